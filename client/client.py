@@ -2,9 +2,14 @@
 import sys
 import grpc
 import time
+import random
 import argparse
+import itertools
+import threading
 import matplotlib.pyplot as plt
 import signal
+from collections import deque
+from contextlib import contextmanager
 from pathlib import Path
 
 client_folder_abs_path = Path(__file__).parent.resolve()
@@ -16,32 +21,218 @@ import worker_pb2
 import worker_pb2_grpc as worker_grpc
 
 sys.path.append(str(client_folder_abs_path / "../utils"))
-from utils import clear_screen, wait_for_enter, get_lb_port, ComputeType
+from utils import clear_screen, wait_for_enter, get_lb_port, routing_key, ComputeType
+from registry import create_registry, set_registry, DEFAULT_REGISTRY
+from channel_pool import ChannelPool
+
+# ============================= GLOBALS =============================
+# Channels to the LB and the workers are reused across requests
+channel_pool = ChannelPool()
+use_channel_pool = True
+
+# With --lease > 0 the client asks the LB for that many assignments at once and
+# picks workers from the lease locally until it expires
+lease_size = 0
+lease = None
+lb_round_trips = 0
+
+# With --proxy the Compute calls go straight to an LB running in proxy mode
+proxy_address = None
+
+# Finished requests not yet reported to the LB, sent along with the next GetServer /
+# GetServers call (feeds the LB's ewma policy without extra round trips)
+worker_ids = {}     # address -> worker id, as given by the LB
+completions = deque(maxlen=1000)
+
+# With --balance rr / ll / p2c the client keeps the LB's worker set up to date over a
+# WatchWorkers stream and picks workers itself, so requests make no LB round trip.
+# The watch thread replaces watched_workers as a whole, entries are dicts with "sent"
+# counting the requests this client sent since the LB's last update of that worker.
+balance_policy = "lb"
+watched_workers = ()
+watch_ready = threading.Event()
+local_rr_counter = itertools.count()
+LOCAL_SENT_WEIGHT = 10      # Score a request sent since the last update adds (ll / p2c), like the LB's in-flight weight
+WATCH_MIN_BACKOFF_SEC = 0.5
+WATCH_MAX_BACKOFF_SEC = 30
+# A call a worker (or the proxy) turns down with one of these codes is tried again on another worker
+COMPUTE_RETRIES = 1
+RETRY_CODES = (grpc.StatusCode.RESOURCE_EXHAUSTED, grpc.StatusCode.UNAVAILABLE)
 
 
 # ============================= FUNCTIONS =============================
-def ask_lb_for_worker_info():
+@contextmanager
+def get_stub(address, stub_cls):
+    if use_channel_pool:
+        with channel_pool.use(address, stub_cls) as stub:
+            yield stub
+    else:
+        # Old behaviour (a new connection per call), kept for the throughput comparison
+        channel = grpc.insecure_channel(address)
+        try:
+            yield stub_cls(channel)
+        finally:
+            channel.close()
+
+
+# `key` is the routing key of the request (see routing_key), used by the LB's ring policy
+def ask_lb_for_worker_info(key=""):
+    global lb_round_trips
+    if proxy_address is not None:
+        return proxy_address
+    if balance_policy != "lb":
+        return pick_from_watch()
+    if lease_size > 0:
+        return pick_from_lease()
     lb_port = get_lb_port()
-    lb_channel = grpc.insecure_channel(f"localhost:{lb_port}")
-    lb_stub = lb_grpc.LBStub(lb_channel)
-    request_obj = lb_pb2.GetServerRequest()
-    response = lb_stub.GetServer(request_obj)
+    request_obj = lb_pb2.GetServerRequest(key=key)
+    take_completions(request_obj.completions)
+    with get_stub(f"localhost:{lb_port}", lb_grpc.LBStub) as lb_stub:
+        response = lb_stub.GetServer(request_obj)
+    lb_round_trips += 1
     if response.err_code == 1:
         print("No servers available. Please try again later.")
         return None
-    return f"{response.ip}:{response.port}"
+    address = f"{response.ip}:{response.port}"
+    worker_ids[address] = response.id
+    return address
 
 
-def sum_to_n(n):
-    server_address = ask_lb_for_worker_info()
-    if server_address is None:
+def renew_lease():
+    global lease, lb_round_trips
+    lb_port = get_lb_port()
+    request_obj = lb_pb2.GetServersRequest()
+    request_obj.count = lease_size
+    # Tell the LB how the previous lease was actually used so its accounting stays correct
+    if lease is not None:
+        request_obj.prev_lease_id = lease["id"]
+        for worker_id, count in lease["usage"].items():
+            request_obj.prev_usage.add(id=worker_id, count=count)
+    take_completions(request_obj.completions)
+    with get_stub(f"localhost:{lb_port}", lb_grpc.LBStub) as lb_stub:
+        response = lb_stub.GetServers(request_obj)
+    lb_round_trips += 1
+
+    lease = None
+    if response.err_code == 1:
         return
+    for server in response.servers:
+        worker_ids[f"{server.ip}:{server.port}"] = server.id
+    lease = {
+        "id": response.lease_id,
+        "servers": [(server.id, f"{server.ip}:{server.port}") for server in response.servers],
+        "weights": [server.weight for server in response.servers],
+        "usage": {server.id: 0 for server in response.servers},
+        "expires": time.monotonic() + response.lease_ttl
+    }
+
+
+def pick_from_lease():
+    if lease is None or time.monotonic() >= lease["expires"]:
+        renew_lease()
+        if lease is None:
+            print("No servers available. Please try again later.")
+            return None
+    worker_id, address = random.choices(lease["servers"], weights=lease["weights"])[0]
+    lease["usage"][worker_id] += 1
+    return address
+
+
+def watch_workers():
+    # Runs in a daemon thread for the lifetime of the client, reconnects with backoff
+    global watched_workers
+    backoff = WATCH_MIN_BACKOFF_SEC
+    while True:
+        try:
+            lb_port = get_lb_port()
+            # The stream keeps the pooled LB channel in use, so idle eviction leaves it open
+            with channel_pool.use(f"localhost:{lb_port}", lb_grpc.LBStub) as lb_stub:
+                for worker_set in lb_stub.WatchWorkers(lb_pb2.WatchWorkersRequest()):
+                    watched_workers = tuple({
+                        "id": worker.id,
+                        "address": f"{worker.ip}:{worker.port}",
+                        "score": worker.score,
+                        "sent": 0
+                    } for worker in worker_set.workers)
+                    watch_ready.set()
+                    backoff = WATCH_MIN_BACKOFF_SEC
+        except grpc.RpcError as e:
+            print(f"Worker watch failed: {e.code()}")
+        time.sleep(backoff)
+        backoff = min(backoff * 2, WATCH_MAX_BACKOFF_SEC)
+
+
+def pick_from_watch():
+    watch_ready.wait(timeout=10)
+    workers = watched_workers
+    if len(workers) == 0:
+        print("No servers available. Please try again later.")
+        return None
+    if balance_policy == "rr":
+        worker = workers[next(local_rr_counter) % len(workers)]
+    elif balance_policy == "ll":
+        worker = min(workers, key=lambda w: w["score"] + w["sent"] * LOCAL_SENT_WEIGHT)
+    else:
+        # p2c
+        if len(workers) == 1:
+            worker = workers[0]
+        else:
+            first, second = random.sample(workers, 2)
+            first_score = first["score"] + first["sent"] * LOCAL_SENT_WEIGHT
+            second_score = second["score"] + second["sent"] * LOCAL_SENT_WEIGHT
+            worker = first if first_score <= second_score else second
+    worker["sent"] += 1
+    return worker["address"]
+
+
+def record_completion(address, latency, ok):
+    # Nothing to report in proxy mode, the LB measures the calls itself
+    worker_id = worker_ids.get(address)
+    if worker_id is not None:
+        completions.append(lb_pb2.Completion(id=worker_id, latency=latency, ok=ok))
+
+def take_completions(field):
+    while completions:
+        field.append(completions.popleft())
+
+
+# Sends a Compute call to the worker and records how long it took
+def compute(server_address, request_obj):
+    start_time = time.perf_counter()
+    ok = False
+    try:
+        with get_stub(server_address, worker_grpc.WorkerStub) as stub:
+            response = stub.Compute(request_obj)
+        ok = response.err_code == 0
+        return response
+    finally:
+        record_completion(server_address, time.perf_counter() - start_time, ok)
+
+
+# Picks a worker for the request and sends it. A failed call (e.g. RESOURCE_EXHAUSTED from
+# a full worker or an abort from the proxy) is retried on another worker up to COMPUTE_RETRIES
+# times and then returned as an err_code 1 response. None if no worker was available.
+def request_compute(key, request_obj):
+    for attempt in range(COMPUTE_RETRIES + 1):
+        server_address = ask_lb_for_worker_info(key)
+        if server_address is None:
+            return None
+        try:
+            return compute(server_address, request_obj)
+        except grpc.RpcError as e:
+            msg = f"{e.code().name}: {e.details()}"
+            if e.code() not in RETRY_CODES or attempt == COMPUTE_RETRIES:
+                return worker_pb2.ComputeResponse(err_code=1, msg=msg)
+            print(f"Request to {server_address} failed ({msg}), retrying on another worker")
+
+
+def sum_to_n(n):
     request_obj = worker_pb2.ComputeRequest()
     request_obj.type = ComputeType.SUM_TO_N.value
     request_obj.n = n
-    channel = grpc.insecure_channel(server_address)
-    stub = worker_grpc.WorkerStub(channel)
-    response = stub.Compute(request_obj)
+    response = request_compute(routing_key(ComputeType.SUM_TO_N.value, n), request_obj)
+    if response is None:
+        return
     if response.err_code == 1:
         print("Error: ", response.msg)
         return
@@ -49,15 +240,12 @@ def sum_to_n(n):
 
 
 def sleep_for_seconds(seconds):
-    server_address = ask_lb_for_worker_info()
-    if server_address is None:
-        return
     request_obj = worker_pb2.ComputeRequest()
     request_obj.type = ComputeType.SLEEP_FOR_SECONDS.value
     request_obj.n = seconds
-    channel = grpc.insecure_channel(server_address)
-    stub = worker_grpc.WorkerStub(channel)
-    response = stub.Compute(request_obj)
+    response = request_compute(routing_key(ComputeType.SLEEP_FOR_SECONDS.value, seconds), request_obj)
+    if response is None:
+        return
     if response.err_code == 1:
         print("Error: ", response.msg)
         return
@@ -121,6 +309,7 @@ def shutdown_handler(signum, frame):
     print("Throughput:", th, "req/s")
     print("Total time taken:", end_time - start_time, "s")
     print("Average response time:", sum(time_arr) / len(time_arr), "s")
+    print("LB round trips:", lb_round_trips)
 
     # Plotting
     plt.plot(time_arr)
@@ -143,9 +332,20 @@ if __name__ == "__main__":
     argparser.add_argument("--load", type=str, default="high", help="Amount of load to simulate")
     argparser.add_argument("--reqs", type=int, default=10, help="Number of requests to run for")
     argparser.add_argument("--id", type=int, help="Client ID", required=True)
+    argparser.add_argument("--compare", action="store_true", help="Script mode: compare throughput with and without the channel pool")
+    argparser.add_argument("--proxy", type=str, default=None, help="Address (ip:port) of an LB in proxy mode to send requests through, skips GetServer and Consul")
+    argparser.add_argument("--registry", type=str, default=DEFAULT_REGISTRY, help="Where the LB is looked up: consul://host:port, or lb://host:port for the built-in registry of an LB")
+    argparser.add_argument("--balance", type=str, default="lb", choices=["lb", "rr", "ll", "p2c"], help="lb: ask the LB for every worker, rr / ll / p2c: watch the worker set (WatchWorkers) and pick locally")
+    argparser.add_argument("--lease", type=int, default=0, help="Number of worker assignments to lease from the LB at once (0 = ask the LB for every request)")
 
     args = argparser.parse_args()
+    set_registry(create_registry(args.registry))
     mode = args.mode
+    lease_size = args.lease
+    proxy_address = args.proxy
+    balance_policy = args.balance
+    if balance_policy != "lb" and proxy_address is None:
+        threading.Thread(target=watch_workers, daemon=True).start()
 
     if mode.lower() == "i":
         menu()
@@ -167,6 +367,24 @@ if __name__ == "__main__":
         else:
             print("Invalid load. Please provide either 'low', 'med', or 'high'.")
             sys.exit(1)
+
+        if args.compare:
+            # Running the same requests with a new channel per call and then with pooled channels
+            throughputs = {}
+            for pooled in (False, True):
+                use_channel_pool = pooled
+                s_time = time.time()
+                for _ in range(n_requests):
+                    sum_to_n(n)
+                e_time = time.time()
+                throughputs[pooled] = n_requests / (e_time - s_time)
+            channel_pool.close_all()
+
+            print()
+            print("Throughput (new channel per call):", throughputs[False], "req/s")
+            print("Throughput (pooled channels):", throughputs[True], "req/s")
+            print("Speedup:", throughputs[True] / throughputs[False], "x")
+            sys.exit(0)
         
         # Simulating load
         start_time = time.time()
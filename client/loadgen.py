@@ -0,0 +1,191 @@
+# ============================= IMPORTS =============================
+import sys
+import grpc
+import time
+import json
+import random
+import asyncio
+import argparse
+from collections import Counter, deque
+from pathlib import Path
+
+loadgen_folder_abs_path = Path(__file__).parent.resolve()
+
+sys.path.append(str(loadgen_folder_abs_path / "../generated"))
+import lb_pb2
+import lb_pb2_grpc as lb_grpc
+import worker_pb2
+import worker_pb2_grpc as worker_grpc
+
+sys.path.append(str(loadgen_folder_abs_path / "../utils"))
+from utils import get_lb_port, routing_key, ComputeType
+from registry import create_registry, set_registry, DEFAULT_REGISTRY
+from channel_pool import ChannelPool
+from histogram import LatencyHistogram
+
+# Open-loop load generator: requests are started on a fixed schedule (constant or
+# Poisson arrivals) no matter how long earlier ones take, so a slow system shows up
+# as growing latency instead of a lower request rate. Latency is measured from the
+# time a request was scheduled, not from when it was actually sent.
+
+# ============================= GLOBALS =============================
+channel_pool = ChannelPool(max_size=1024, channel_factory=grpc.aio.insecure_channel)
+proxy_address = None    # With --proxy requests go straight to an LB in proxy mode
+completions = deque(maxlen=10000)   # Finished requests, reported with the next GetServer (LB's ewma policy)
+
+# ============================= CLASSES =============================
+class LoadStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()   # Successful requests
+        self.sent = 0
+        self.succeeded = 0
+        self.errors = Counter()     # Error -> count
+        self.shed = 0               # Not sent because --max_in_flight requests were outstanding
+        self.in_flight = 0
+
+    # Send rate is over the sending period, throughput also waits for the last responses
+    def to_dict(self, sending_time, elapsed):
+        completed = self.succeeded + sum(self.errors.values())
+        return {
+            "sending_time": sending_time,
+            "elapsed": elapsed,
+            "sent": self.sent,
+            "succeeded": self.succeeded,
+            "failed": sum(self.errors.values()),
+            "shed": self.shed,
+            "send_rate": self.sent / sending_time,
+            "throughput": self.succeeded / elapsed,
+            "error_rate": (completed - self.succeeded) / completed if completed else 0.0,
+            "errors": dict(self.errors),
+            "latency": self.latency.to_dict()
+        }
+
+
+# ============================= FUNCTIONS =============================
+# Returns (address, worker id), the id is None in proxy mode
+async def get_worker_address(request_obj):
+    if proxy_address is not None:
+        return proxy_address, None
+    # The registry lookup is cached after the first call, only that one blocks
+    lb_port = get_lb_port()
+    lb_stub = channel_pool.get_stub(f"localhost:{lb_port}", lb_grpc.LBStub)
+    lb_request = lb_pb2.GetServerRequest(key=routing_key(request_obj.type, request_obj.n))
+    while completions:
+        lb_request.completions.append(completions.popleft())
+    response = await lb_stub.GetServer(lb_request)
+    if response.err_code != 0:
+        raise LookupError(response.msg)
+    return f"{response.ip}:{response.port}", response.id
+
+async def send_request(stats, request_obj, scheduled, timeout):
+    stats.sent += 1
+    stats.in_flight += 1
+    worker_id = None
+    ok = False
+    try:
+        address, worker_id = await get_worker_address(request_obj)
+        sent = time.perf_counter()
+        # --timeout may be longer than the pool's idle timeout
+        with channel_pool.use(address, worker_grpc.WorkerStub) as stub:
+            response = await stub.Compute(request_obj, timeout=timeout)
+        if response.err_code != 0:
+            stats.errors[response.msg] += 1
+            return
+        ok = True
+        stats.succeeded += 1
+        stats.latency.record(time.perf_counter() - scheduled)
+    except grpc.RpcError as e:
+        stats.errors[e.code().name] += 1
+    except LookupError as e:
+        stats.errors[str(e)] += 1
+    finally:
+        stats.in_flight -= 1
+        if worker_id is not None:
+            # Service time of the worker, without the client side queueing
+            completions.append(lb_pb2.Completion(id=worker_id, latency=time.perf_counter() - sent, ok=ok))
+
+def next_interval(rate, arrivals):
+    if arrivals == "poisson":
+        return random.expovariate(rate)
+    return 1 / rate
+
+async def run_load(rate, duration, arrivals, request_obj, timeout, max_in_flight):
+    stats = LoadStats()
+    tasks = set()
+    start = time.perf_counter()
+    end = start + duration
+    scheduled = start
+
+    while scheduled < end:
+        now = time.perf_counter()
+        if scheduled > now:
+            await asyncio.sleep(scheduled - now)
+        # asyncio.sleep is only ms accurate, start every request that is due so the
+        # average rate stays right even above 1000 req/s
+        now = time.perf_counter()
+        while scheduled <= now and scheduled < end:
+            if max_in_flight is not None and stats.in_flight >= max_in_flight:
+                stats.shed += 1
+            else:
+                task = asyncio.create_task(send_request(stats, request_obj, scheduled, timeout))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            scheduled += next_interval(rate, arrivals)
+
+    # Requests still running count towards the results, but not towards the sending time
+    sending_time = time.perf_counter() - start
+    if tasks:
+        await asyncio.wait(tasks)
+    elapsed = time.perf_counter() - start
+    return stats, sending_time, elapsed
+
+def print_summary(report):
+    latency = report["latency"]
+    print(f"Sent: {report['sent']} in {report['sending_time']:.2f}s ({report['send_rate']:.1f} req/s, target {report['config']['rate']} req/s)")
+    print(f"Succeeded: {report['succeeded']}  Failed: {report['failed']}  Shed: {report['shed']}  Error rate: {report['error_rate'] * 100:.2f}%")
+    print(f"Throughput: {report['throughput']:.1f} req/s")
+    if latency["count"]:
+        percentiles = "  ".join(f"{name}={value * 1000:.2f}ms" for name, value in latency["percentiles"].items())
+        print(f"Latency: {percentiles}  max={latency['max'] * 1000:.2f}ms  mean={latency['mean'] * 1000:.2f}ms")
+    for error, count in report["errors"].items():
+        print(f"  {error}: {count}")
+
+async def main(args):
+    request_obj = worker_pb2.ComputeRequest()
+    request_obj.type = ComputeType[args.type.upper()].value
+    request_obj.n = args.n
+
+    # Warm up the registry lookup cache off the event loop
+    if proxy_address is None:
+        await asyncio.to_thread(get_lb_port)
+
+    stats, sending_time, elapsed = await run_load(args.rate, args.duration, args.arrivals, request_obj, args.timeout, args.max_in_flight)
+    channel_pool.close_all()
+
+    report = stats.to_dict(sending_time, elapsed)
+    report["config"] = vars(args)
+    return report
+
+
+# ============================= MAIN =============================
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Open-loop load generator")
+    argparser.add_argument("--rate", type=float, default=100, help="Target requests per second")
+    argparser.add_argument("--duration", type=float, default=10, help="Seconds to generate load for")
+    argparser.add_argument("--arrivals", type=str, default="poisson", choices=["poisson", "constant"], help="Poisson (exponential gaps) or evenly spaced arrivals")
+    argparser.add_argument("--type", type=str, default="sum_to_n", choices=["sum_to_n", "sleep_for_seconds"], help="Compute request type")
+    argparser.add_argument("--n", type=int, default=1000, help="Argument of the Compute request")
+    argparser.add_argument("--timeout", type=float, default=30, help="Per-request deadline in seconds")
+    argparser.add_argument("--max_in_flight", type=int, default=10000, help="Arrivals are dropped (counted as shed) while this many requests are outstanding")
+    argparser.add_argument("--proxy", type=str, default=None, help="Address (ip:port) of an LB in proxy mode to send requests through, skips GetServer")
+    argparser.add_argument("--registry", type=str, default=DEFAULT_REGISTRY, help="Where the LB is looked up: consul://host:port, or lb://host:port for the built-in registry of an LB")
+    argparser.add_argument("--report", type=str, default="./test_files/loadgen_report.json", help="Where to write the JSON report")
+    args = argparser.parse_args()
+    set_registry(create_registry(args.registry))
+    proxy_address = args.proxy
+
+    report = asyncio.run(main(args))
+    print_summary(report)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.report}")
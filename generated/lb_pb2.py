@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x08lb.proto\x12\x02lb\"=\n\x15RegisterWorkerRequest\x12\n\n\x02id\x18\x01 \x01(\x05\x12\n\n\x02ip\x18\x02 \x01(\t\x12\x0c\n\x04port\x18\x03 \x01(\x05\"7\n\x16RegisterWorkerResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0b\n\x03msg\x18\x02 \x01(\t\"\x12\n\x10GetServerRequest\"X\n\x11GetServerResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0b\n\x03msg\x18\x02 \x01(\t\x12\n\n\x02ip\x18\x03 \x01(\t\x12\x0c\n\x04port\x18\x04 \x01(\x05\x12\n\n\x02id\x18\x05 \x01(\x05\"-\n\x11ReportLoadRequest\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0c\n\x04load\x18\x02 \x01(\x02\"3\n\x12ReportLoadResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0b\n\x03msg\x18\x02 \x01(\t2\x8b\x01\n\x02LB\x12I\n\x0eRegisterWorker\x12\x19.lb.RegisterWorkerRequest\x1a\x1a.lb.RegisterWorkerResponse\"\x00\x12:\n\tGetServer\x12\x14.lb.GetServerRequest\x1a\x15.lb.GetServerResponse\"\x00\x32M\n\x0cLoadListener\x12=\n\nReportLoad\x12\x15.lb.ReportLoadRequest\x1a\x16.lb.ReportLoadResponse\"\x00\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x08lb.proto\x12\x02lb\"O\n\x15RegisterWorkerRequest\x12\n\n\x02id\x18\x01 \x01(\x05\x12\n\n\x02ip\x18\x02 \x01(\t\x12\x0c\n\x04port\x18\x03 \x01(\x05\x12\x10\n\x08\x63\x61pacity\x18\x04 \x01(\x05\"7\n\x16RegisterWorkerResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0b\n\x03msg\x18\x02 \x01(\t\"D\n\x10GetServerRequest\x12\x0b\n\x03key\x18\x01 \x01(\t\x12#\n\x0b\x63ompletions\x18\x02 \x03(\x0b\x32\x0e.lb.Completion\"5\n\nCompletion\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0f\n\x07latency\x18\x02 \x01(\x01\x12\n\n\x02ok\x18\x03 \x01(\x08\"X\n\x11GetServerResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0b\n\x03msg\x18\x02 \x01(\t\x12\n\n\x02ip\x18\x03 \x01(\t\x12\x0c\n\x04port\x18\x04 \x01(\x05\x12\n\n\x02id\x18\x05 \x01(\x05\"\x83\x01\n\x11GetServersRequest\x12\r\n\x05\x63ount\x18\x01 \x01(\x05\x12\x15\n\rprev_lease_id\x18\x02 \x01(\x03\x12#\n\nprev_usage\x18\x03 \x03(\x0b\x32\x0f.lb.ServerUsage\x12#\n\x0b\x63ompletions\x18\x04 \x03(\x0b\x32\x0e.lb.Completion\"\x15\n\x13WatchWorkersRequest\"=\n\tWorkerSet\x12\x0f\n\x07version\x18\x01 \x01(\x03\x12\x1f\n\x07workers\x18\x02 \x03(\x0b\x32\x0e.lb.WorkerInfo\"r\n\nWorkerInfo\x12\n\n\x02id\x18\x01 \x01(\x05\x12\n\n\x02ip\x18\x02 \x01(\t\x12\x0c\n\x04port\x18\x03 \x01(\x05\x12\r\n\x05score\x18\x04 \x01(\x01\x12\x0c\n\x04load\x18\x05 \x01(\x02\x12\x0e\n\x06weight\x18\x06 \x01(\x05\x12\x11\n\tin_flight\x18\x07 \x01(\x05\"(\n\x0bServerUsage\x12\n\n\x02id\x18\x01 \x01(\x05\x12\r\n\x05\x63ount\x18\x02 \x01(\x05\"B\n\nServerInfo\x12\n\n\x02ip\x18\x01 \x01(\t\x12\x0c\n\x04port\x18\x02 \x01(\x05\x12\n\n\x02id\x18\x03 \x01(\x05\x12\x0e\n\x06weight\x18\x04 \x01(\x02\"y\n\x12GetServersResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0b\n\x03msg\x18\x02 \x01(\t\x12\x1f\n\x07servers\x18\x03 \x03(\x0b\x32\x0e.lb.ServerInfo\x12\x10\n\x08lease_id\x18\x04 \x01(\x03\x12\x11\n\tlease_ttl\x18\x05 \x01(\x02\"z\n\x11ReportLoadRequest\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0c\n\x04load\x18\x02 \x01(\x02\x12\x11\n\tin_flight\x18\x03 \x01(\x05\x12\x13\n\x0bqueue_depth\x18\x04 \x01(\x05\x12\x10\n\x08\x63pu_ewma\x18\x05 \x01(\x02\x12\x11\n\tsaturated\x18\x06 \x01(\x08\"3\n\x12ReportLoadResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0b\n\x03msg\x18\x02 \x01(\t\"E\n\x12StreamLoadResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0b\n\x03msg\x18\x02 \x01(\t\x12\x10\n\x08interval\x18\x03 \x01(\x02\",\n\x18SetReportIntervalRequest\x12\x10\n\x08interval\x18\x01 \x01(\x02\"X\n\x0cServiceEntry\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\n\n\x02id\x18\x02 \x01(\t\x12\x0f\n\x07\x61\x64\x64ress\x18\x03 \x01(\t\x12\x0c\n\x04port\x18\x04 \x01(\x05\x12\x0f\n\x07passing\x18\x05 \x01(\x08\";\n\x16RegisterServiceRequest\x12!\n\x07service\x18\x01 \x01(\x0b\x32\x10.lb.ServiceEntry\"&\n\x18\x44\x65registerServiceRequest\x12\n\n\x02id\x18\x01 \x01(\t\"1\n\x10RegistryResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0b\n\x03msg\x18\x02 \x01(\t\"\x1d\n\rLookupRequest\x12\x0c\n\x04name\x18\x01 \x01(\t\"S\n\x0eLookupResponse\x12\x10\n\x08\x65rr_code\x18\x01 \x01(\x05\x12\x0b\n\x03msg\x18\x02 \x01(\t\x12\"\n\x08services\x18\x03 \x03(\x0b\x32\x10.lb.ServiceEntry2\x86\x02\n\x02LB\x12I\n\x0eRegisterWorker\x12\x19.lb.RegisterWorkerRequest\x1a\x1a.lb.RegisterWorkerResponse\"\x00\x12:\n\tGetServer\x12\x14.lb.GetServerRequest\x1a\x15.lb.GetServerResponse\"\x00\x12=\n\nGetServers\x12\x15.lb.GetServersRequest\x1a\x16.lb.GetServersResponse\"\x00\x12:\n\x0cWatchWorkers\x12\x17.lb.WatchWorkersRequest\x1a\r.lb.WorkerSet\"\x00\x30\x01\x32\xdd\x01\n\x0cLoadListener\x12=\n\nReportLoad\x12\x15.lb.ReportLoadRequest\x1a\x16.lb.ReportLoadResponse\"\x00\x12\x41\n\nStreamLoad\x12\x15.lb.ReportLoadRequest\x1a\x16.lb.StreamLoadResponse\"\x00(\x01\x30\x01\x12K\n\x11SetReportInterval\x12\x1c.lb.SetReportIntervalRequest\x1a\x16.lb.StreamLoadResponse\"\x00\x32\xc1\x01\n\x08Registry\x12>\n\x08Register\x12\x1a.lb.RegisterServiceRequest\x1a\x14.lb.RegistryResponse\"\x00\x12\x42\n\nDeregister\x12\x1c.lb.DeregisterServiceRequest\x1a\x14.lb.RegistryResponse\"\x00\x12\x31\n\x06Lookup\x12\x11.lb.LookupRequest\x1a\x12.lb.LookupResponse\"\x00\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -32,19 +32,53 @@ _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'lb_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
   _globals['_REGISTERWORKERREQUEST']._serialized_start=16
-  _globals['_REGISTERWORKERREQUEST']._serialized_end=77
-  _globals['_REGISTERWORKERRESPONSE']._serialized_start=79
-  _globals['_REGISTERWORKERRESPONSE']._serialized_end=134
-  _globals['_GETSERVERREQUEST']._serialized_start=136
-  _globals['_GETSERVERREQUEST']._serialized_end=154
-  _globals['_GETSERVERRESPONSE']._serialized_start=156
-  _globals['_GETSERVERRESPONSE']._serialized_end=244
-  _globals['_REPORTLOADREQUEST']._serialized_start=246
-  _globals['_REPORTLOADREQUEST']._serialized_end=291
-  _globals['_REPORTLOADRESPONSE']._serialized_start=293
-  _globals['_REPORTLOADRESPONSE']._serialized_end=344
-  _globals['_LB']._serialized_start=347
-  _globals['_LB']._serialized_end=486
-  _globals['_LOADLISTENER']._serialized_start=488
-  _globals['_LOADLISTENER']._serialized_end=565
+  _globals['_REGISTERWORKERREQUEST']._serialized_end=95
+  _globals['_REGISTERWORKERRESPONSE']._serialized_start=97
+  _globals['_REGISTERWORKERRESPONSE']._serialized_end=152
+  _globals['_GETSERVERREQUEST']._serialized_start=154
+  _globals['_GETSERVERREQUEST']._serialized_end=222
+  _globals['_COMPLETION']._serialized_start=224
+  _globals['_COMPLETION']._serialized_end=277
+  _globals['_GETSERVERRESPONSE']._serialized_start=279
+  _globals['_GETSERVERRESPONSE']._serialized_end=367
+  _globals['_GETSERVERSREQUEST']._serialized_start=370
+  _globals['_GETSERVERSREQUEST']._serialized_end=501
+  _globals['_WATCHWORKERSREQUEST']._serialized_start=503
+  _globals['_WATCHWORKERSREQUEST']._serialized_end=524
+  _globals['_WORKERSET']._serialized_start=526
+  _globals['_WORKERSET']._serialized_end=587
+  _globals['_WORKERINFO']._serialized_start=589
+  _globals['_WORKERINFO']._serialized_end=703
+  _globals['_SERVERUSAGE']._serialized_start=705
+  _globals['_SERVERUSAGE']._serialized_end=745
+  _globals['_SERVERINFO']._serialized_start=747
+  _globals['_SERVERINFO']._serialized_end=813
+  _globals['_GETSERVERSRESPONSE']._serialized_start=815
+  _globals['_GETSERVERSRESPONSE']._serialized_end=936
+  _globals['_REPORTLOADREQUEST']._serialized_start=938
+  _globals['_REPORTLOADREQUEST']._serialized_end=1060
+  _globals['_REPORTLOADRESPONSE']._serialized_start=1062
+  _globals['_REPORTLOADRESPONSE']._serialized_end=1113
+  _globals['_STREAMLOADRESPONSE']._serialized_start=1115
+  _globals['_STREAMLOADRESPONSE']._serialized_end=1184
+  _globals['_SETREPORTINTERVALREQUEST']._serialized_start=1186
+  _globals['_SETREPORTINTERVALREQUEST']._serialized_end=1230
+  _globals['_SERVICEENTRY']._serialized_start=1232
+  _globals['_SERVICEENTRY']._serialized_end=1320
+  _globals['_REGISTERSERVICEREQUEST']._serialized_start=1322
+  _globals['_REGISTERSERVICEREQUEST']._serialized_end=1381
+  _globals['_DEREGISTERSERVICEREQUEST']._serialized_start=1383
+  _globals['_DEREGISTERSERVICEREQUEST']._serialized_end=1421
+  _globals['_REGISTRYRESPONSE']._serialized_start=1423
+  _globals['_REGISTRYRESPONSE']._serialized_end=1472
+  _globals['_LOOKUPREQUEST']._serialized_start=1474
+  _globals['_LOOKUPREQUEST']._serialized_end=1503
+  _globals['_LOOKUPRESPONSE']._serialized_start=1505
+  _globals['_LOOKUPRESPONSE']._serialized_end=1588
+  _globals['_LB']._serialized_start=1591
+  _globals['_LB']._serialized_end=1853
+  _globals['_LOADLISTENER']._serialized_start=1856
+  _globals['_LOADLISTENER']._serialized_end=2077
+  _globals['_REGISTRY']._serialized_start=2080
+  _globals['_REGISTRY']._serialized_end=2273
 # @@protoc_insertion_point(module_scope)
@@ -44,6 +44,16 @@ class LBStub(object):
                 request_serializer=lb__pb2.GetServerRequest.SerializeToString,
                 response_deserializer=lb__pb2.GetServerResponse.FromString,
                 _registered_method=True)
+        self.GetServers = channel.unary_unary(
+                '/lb.LB/GetServers',
+                request_serializer=lb__pb2.GetServersRequest.SerializeToString,
+                response_deserializer=lb__pb2.GetServersResponse.FromString,
+                _registered_method=True)
+        self.WatchWorkers = channel.unary_stream(
+                '/lb.LB/WatchWorkers',
+                request_serializer=lb__pb2.WatchWorkersRequest.SerializeToString,
+                response_deserializer=lb__pb2.WorkerSet.FromString,
+                _registered_method=True)
 
 
 class LBServicer(object):
@@ -61,6 +71,20 @@ class LBServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def GetServers(self, request, context):
+        """Lease of several worker assignments that the client can use until lease_ttl expires
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def WatchWorkers(self, request, context):
+        """Pushes the available workers whenever they change, for client-side load balancing
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_LBServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -74,6 +98,16 @@ def add_LBServicer_to_server(servicer, server):
                     request_deserializer=lb__pb2.GetServerRequest.FromString,
                     response_serializer=lb__pb2.GetServerResponse.SerializeToString,
             ),
+            'GetServers': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetServers,
+                    request_deserializer=lb__pb2.GetServersRequest.FromString,
+                    response_serializer=lb__pb2.GetServersResponse.SerializeToString,
+            ),
+            'WatchWorkers': grpc.unary_stream_rpc_method_handler(
+                    servicer.WatchWorkers,
+                    request_deserializer=lb__pb2.WatchWorkersRequest.FromString,
+                    response_serializer=lb__pb2.WorkerSet.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'lb.LB', rpc_method_handlers)
@@ -139,6 +173,60 @@ class LB(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def GetServers(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/lb.LB/GetServers',
+            lb__pb2.GetServersRequest.SerializeToString,
+            lb__pb2.GetServersResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def WatchWorkers(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/lb.LB/WatchWorkers',
+            lb__pb2.WatchWorkersRequest.SerializeToString,
+            lb__pb2.WorkerSet.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
 
 class LoadListenerStub(object):
     """Missing associated documentation comment in .proto file."""
@@ -154,6 +242,16 @@ class LoadListenerStub(object):
                 request_serializer=lb__pb2.ReportLoadRequest.SerializeToString,
                 response_deserializer=lb__pb2.ReportLoadResponse.FromString,
                 _registered_method=True)
+        self.StreamLoad = channel.stream_stream(
+                '/lb.LoadListener/StreamLoad',
+                request_serializer=lb__pb2.ReportLoadRequest.SerializeToString,
+                response_deserializer=lb__pb2.StreamLoadResponse.FromString,
+                _registered_method=True)
+        self.SetReportInterval = channel.unary_unary(
+                '/lb.LoadListener/SetReportInterval',
+                request_serializer=lb__pb2.SetReportIntervalRequest.SerializeToString,
+                response_deserializer=lb__pb2.StreamLoadResponse.FromString,
+                _registered_method=True)
 
 
 class LoadListenerServicer(object):
@@ -165,6 +263,20 @@ class LoadListenerServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamLoad(self, request_iterator, context):
+        """Long-lived stream of load reports, the LB answers with the reporting interval it wants
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def SetReportInterval(self, request, context):
+        """Changes the reporting interval the LB asks for, open streams get it with their next report
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_LoadListenerServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -173,6 +285,16 @@ def add_LoadListenerServicer_to_server(servicer, server):
                     request_deserializer=lb__pb2.ReportLoadRequest.FromString,
                     response_serializer=lb__pb2.ReportLoadResponse.SerializeToString,
             ),
+            'StreamLoad': grpc.stream_stream_rpc_method_handler(
+                    servicer.StreamLoad,
+                    request_deserializer=lb__pb2.ReportLoadRequest.FromString,
+                    response_serializer=lb__pb2.StreamLoadResponse.SerializeToString,
+            ),
+            'SetReportInterval': grpc.unary_unary_rpc_method_handler(
+                    servicer.SetReportInterval,
+                    request_deserializer=lb__pb2.SetReportIntervalRequest.FromString,
+                    response_serializer=lb__pb2.StreamLoadResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'lb.LoadListener', rpc_method_handlers)
@@ -210,3 +332,221 @@ class LoadListener(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def StreamLoad(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/lb.LoadListener/StreamLoad',
+            lb__pb2.ReportLoadRequest.SerializeToString,
+            lb__pb2.StreamLoadResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def SetReportInterval(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/lb.LoadListener/SetReportInterval',
+            lb__pb2.SetReportIntervalRequest.SerializeToString,
+            lb__pb2.StreamLoadResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+
+class RegistryStub(object):
+    """Built-in service registry served by the LB (--registry=lb://host:port), an
+    alternative to Consul that needs no external agent
+    """
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.Register = channel.unary_unary(
+                '/lb.Registry/Register',
+                request_serializer=lb__pb2.RegisterServiceRequest.SerializeToString,
+                response_deserializer=lb__pb2.RegistryResponse.FromString,
+                _registered_method=True)
+        self.Deregister = channel.unary_unary(
+                '/lb.Registry/Deregister',
+                request_serializer=lb__pb2.DeregisterServiceRequest.SerializeToString,
+                response_deserializer=lb__pb2.RegistryResponse.FromString,
+                _registered_method=True)
+        self.Lookup = channel.unary_unary(
+                '/lb.Registry/Lookup',
+                request_serializer=lb__pb2.LookupRequest.SerializeToString,
+                response_deserializer=lb__pb2.LookupResponse.FromString,
+                _registered_method=True)
+
+
+class RegistryServicer(object):
+    """Built-in service registry served by the LB (--registry=lb://host:port), an
+    alternative to Consul that needs no external agent
+    """
+
+    def Register(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Deregister(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Lookup(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_RegistryServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'Register': grpc.unary_unary_rpc_method_handler(
+                    servicer.Register,
+                    request_deserializer=lb__pb2.RegisterServiceRequest.FromString,
+                    response_serializer=lb__pb2.RegistryResponse.SerializeToString,
+            ),
+            'Deregister': grpc.unary_unary_rpc_method_handler(
+                    servicer.Deregister,
+                    request_deserializer=lb__pb2.DeregisterServiceRequest.FromString,
+                    response_serializer=lb__pb2.RegistryResponse.SerializeToString,
+            ),
+            'Lookup': grpc.unary_unary_rpc_method_handler(
+                    servicer.Lookup,
+                    request_deserializer=lb__pb2.LookupRequest.FromString,
+                    response_serializer=lb__pb2.LookupResponse.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'lb.Registry', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+    server.add_registered_method_handlers('lb.Registry', rpc_method_handlers)
+
+
+ # This class is part of an EXPERIMENTAL API.
+class Registry(object):
+    """Built-in service registry served by the LB (--registry=lb://host:port), an
+    alternative to Consul that needs no external agent
+    """
+
+    @staticmethod
+    def Register(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/lb.Registry/Register',
+            lb__pb2.RegisterServiceRequest.SerializeToString,
+            lb__pb2.RegistryResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Deregister(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/lb.Registry/Deregister',
+            lb__pb2.DeregisterServiceRequest.SerializeToString,
+            lb__pb2.RegistryResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Lookup(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/lb.Registry/Lookup',
+            lb__pb2.LookupRequest.SerializeToString,
+            lb__pb2.LookupResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -1,7 +1,8 @@
 # ============================= IMPORTS =============================
 import argparse
-import json
-import subprocess
+import asyncio
+import math
+import random
 import requests
 import sys
 import grpc
@@ -10,6 +11,9 @@ from concurrent import futures
 import time
 import threading
 import signal
+import itertools
+from collections import namedtuple, Counter
+from contextlib import contextmanager
 from pathlib import Path
 
 lb_folder_path = Path(__file__).parent.resolve()
@@ -21,187 +25,890 @@ import worker_pb2
 import worker_pb2_grpc as worker_grpc
 
 sys.path.append(str(lb_folder_path / "../utils"))
-from utils import clear_screen, CONSUL_URL_WORKER
+from utils import clear_screen, worker_service_id, routing_key
+from registry import create_registry, set_registry, LocalRegistry, DEFAULT_REGISTRY
+from metrics import TimingMetric, timed_lock
+from indexed_heap import IndexedMinHeap
+from weighted_rr import SmoothWeightedRoundRobin
+from hash_ring import ConsistentHashRing
+from change_feed import ChangeFeed
+from channel_pool import ChannelPool
+from load_history import LoadHistory
+from metrics_log import MetricsLogWriter
+from log_pipeline import setup_logging, parse_log_limits
 
 # ============================= GLOBALS =============================
-WAIT_TIME_SEC = 5
-
 my_port = None
 my_interval = None
 my_policy = None
-
+my_mode = "lookaside"   # "lookaside" (clients ask for a worker) or "proxy" (LB forwards Compute calls)
+my_report_interval = None   # Load reporting interval pushed to workers over StreamLoad, changed with SetReportInterval
+
+# The worker table is published as an immutable WorkerSnapshot that GetServer reads
+# without any lock. Writers (RegisterWorker, ReportLoad, health watch) serialise on
+# workers_lock, modify `workers` / `workers_by_id` / `ll_heap` and publish a new
+# snapshot when membership, status or saturation changes. Per-worker counters ("load",
+# "outstanding") are updated in place under workers_lock, a single store is atomic for readers.
 workers = []
+workers_by_id = {}      # id -> entry in workers
+ll_heap = IndexedMinHeap()  # Available workers keyed by load (Least-Loaded policy)
 workers_lock = threading.Lock()
+workers_lock_metric = TimingMetric("workers_lock held")
+
+WorkerSnapshot = namedtuple("WorkerSnapshot", ["workers", "by_id", "active"])
+worker_snapshot = WorkerSnapshot((), {}, ())
+
+worker_health = {}  # port -> "active" / "inactive" as last reported by the registry
+health_watch = None
+registry = None     # Consul, or the LocalRegistry served by this LB (--registry)
+
+rr_counter = itertools.count()  # Round-robin cursor, next() on it is atomic
+wrr = SmoothWeightedRoundRobin()    # Available workers weighted by their capacity (wrr policy)
+
+# ring policy: consistent hashing of the request's routing key over the healthy workers,
+# with bounded loads: a worker already holding more than ceil((1 + ring_epsilon) * average)
+# requests is passed over for the next one clockwise (--ring_epsilon, --ring_vnodes)
+ring = ConsistentHashRing(vnodes=100)
+ring_epsilon = 0.25
+# Sum of the available workers' "ring_load", kept up to date by track_ring_load() so the
+# bound costs O(1) per pick instead of a pass over the workers (GetServers picks up to
+# MAX_LEASE_SIZE times per call). Guarded by workers_lock, like the check-and-assign.
+ring_load_total = 0
+
+# Each assignment made since the worker's last load report counts as this much load (%)
+# when comparing the two sampled workers in the p2c policy
+P2C_OUTSTANDING_WEIGHT = 10
+
+# Provisional load ("outstanding"): assignments the worker's last load report can't
+# reflect yet. Every assignment adds one, it fades with the expected job duration (the
+# worker's observed peak EWMA latency, or ll_job_sec before any was observed), client
+# completions take one off and the next load report resets it. ll adds it to the
+# reported score as in-flight requests, so picks between two reports don't all go to
+# the same worker.
+ll_job_sec = 1.0
+
+# Composite load score used by ll / p2c:
+#   score = cpu_weight * cpu_ewma + in_flight_weight * in_flight + queue_weight * queue_depth
+# (set with --ll_weights). With --ll_max_score ll answers "No servers available" once
+# the least loaded worker reaches that score, e.g. --ll_weights=1,0,0 --ll_max_score=100
+# is the old behaviour of rejecting when every worker is at 100% CPU.
+ll_weights = (1.0, 10.0, 10.0)
+ll_max_score = None
+
+# Leases handed out by GetServers: lease id -> (expiry time, {worker id: assignments granted})
+leases = {}
+leases_lock = threading.Lock()
+lease_counter = itertools.count(1)
+lease_ttl = 1.0
+MAX_LEASE_SIZE = 1000
+
+# Proxy mode: channels to the workers
+backend_pool = ChannelPool(max_size=1024)
+aio_backend_pool = ChannelPool(max_size=1024, channel_factory=grpc.aio.insecure_channel)
+NO_DEADLINE_SEC = 365 * 24 * 3600
+SHUTDOWN_GRACE_SEC = 1.0    # --server=aio: how long running calls may take to finish on shutdown
+
+# ewma policy ("peak EWMA" as in Finagle / linkerd): per worker latency average that jumps
+# straight up to any slower observation and otherwise decays with time constant
+# ewma_decay_sec (--ewma_decay). Observations come from the proxy path and from
+# completions piggybacked by clients on GetServer / GetServers. The cost of a worker
+# is the average times (estimated in-flight requests + 1), p2c picks the cheaper one.
+ewma_decay_sec = 10.0
+EWMA_PENALTY_SEC = 1.0  # Latency counted for failed calls and for workers with requests pending but no observation yet
+
+# Reported load per worker id, bounded (see LoadHistory)
+load_history = {}
+history_size = 3600         # Raw samples kept per worker
+history_bucket_sec = 60.0   # Older samples are downsampled to buckets of this many seconds
+metrics_log = None          # Every load report is appended to this binary log (see test_files/visualise_load.py)
+
+# Types of the per-request log messages, see --log_sample / --log_rate
+LOG_GET_SERVER = {"log_type": "get_server"}
+LOG_GET_SERVERS = {"log_type": "get_servers"}
+LOG_LOAD_REPORT = {"log_type": "load_report"}
+
+# WatchWorkers: bumped on every membership / status / load change. Membership changes
+# are pushed to watchers right away, load-only changes at most every watch_interval seconds.
+worker_feed = ChangeFeed()
+watch_interval = 1.0
+watch_slots = threading.BoundedSemaphore(128)   # --max_watchers, every watcher holds a server thread in threads mode
+
+server = None
+ll_server = None
 
-rr_last_used_index = -1
+# ============================= CLASSES =============================
+# One WatchWorkers stream, shared by the threaded and asyncio servicers, which only
+# differ in how they wait for the next change
+class WorkerWatch:
+    def __init__(self):
+        self.sent_snapshot = None
+        self.sent_version = -1
+        self.sent_time = 0.0
+        logging.info("Worker watch opened")
+
+    # None if there are already --max_watchers open streams
+    @classmethod
+    def open(cls):
+        if not watch_slots.acquire(blocking=False):
+            return None
+        return cls()
+
+    def poll(self):
+        # (WorkerSet to send now, None, 0) or (None, version to wait on, seconds to wait at most)
+        version = worker_feed.version
+        snapshot = worker_snapshot
+        timeout = watch_update_due(snapshot, self.sent_snapshot, version, self.sent_version, self.sent_time)
+        if timeout > 0:
+            return None, version, timeout
+        self.sent_snapshot, self.sent_version, self.sent_time = snapshot, version, time.monotonic()
+        return make_worker_set(snapshot, version), None, 0
+
+    def close(self):
+        watch_slots.release()
+        logging.info("Worker watch closed")
+
+
+# One worker's StreamLoad call, shared by the threaded and asyncio Load Listeners. The first
+# message tells the worker how often to report, after that we only answer again when the
+# interval we want changes. With the built-in registry a worker is healthy while its load
+# stream is open.
+class LoadStream:
+    def __init__(self):
+        self.interval = my_report_interval
+        self.worker_id = None
+
+    def opened(self):
+        return lb_pb2.StreamLoadResponse(err_code=0, msg="Load stream opened", interval=self.interval)
+
+    def handle(self, request):
+        # Applies one report, returns the response to send back (None: nothing to send)
+        logging.info("Load streamed from worker %d = %s%%", request.id, request.load, extra=LOG_LOAD_REPORT)
+        if self.worker_id is None:
+            self.worker_id = request.id
+            registry.set_passing(worker_service_id(self.worker_id), True)
+        apply_load_report(request)
+        if my_report_interval == self.interval:
+            return None
+        self.interval = my_report_interval
+        return lb_pb2.StreamLoadResponse(err_code=0, msg="Report interval changed", interval=self.interval)
+
+    def close(self):
+        if self.worker_id is not None:
+            registry.set_passing(worker_service_id(self.worker_id), False)
+        logging.info("Load stream closed")
 
-loads = {}
 
-# ============================= CLASSES =============================
 class LBServicer(lb_grpc.LBServicer):
     def RegisterWorker(self, request, context):
         logging.info(f"Register Worker request received from worker {request.id}")
-        with workers_lock:
-            workers.append({
-                "id": request.id,
+        with timed_lock(workers_lock, workers_lock_metric):
+            worker = workers_by_id.get(request.id)
+            if worker is None:
+                worker = {"id": request.id,
+                          "ring_load": 0,           # Request count counted in ring_load_total, see track_ring_load
+                          "ring_counted": False}    # Whether it is counted (worker was available)
+                workers.append(worker)
+                workers_by_id[request.id] = worker
+            # A worker re-registering (e.g. after a restart) reuses its old entry
+            worker.update({
                 "ip": request.ip,
                 "port": request.port,
-                "status": "active",
-                "load": 0
+                "capacity": max(1, request.capacity),
+                "status": worker_health.get(request.port, "active"),
+                "load": 0,
+                "cpu_ewma": 0,
+                "in_flight": 0,
+                "queue_depth": 0,
+                "score": 0,
+                "outstanding": 0,       # Provisional load, see ll_job_sec
+                "outstanding_time": 0.0,    # time.monotonic() "outstanding" was last updated
+                "ring_pending": 0,      # "outstanding" as a whole count without decay (ring policy bound)
+                "assigned": 0,  # Requests routed to this worker (GetServer + used lease assignments)
+                "proxy_in_flight": 0,   # Proxy mode: calls currently forwarded to this worker
+                "peak_ewma": 0.0,       # Peak EWMA of the observed latency (s), see ewma_decay_sec
+                "peak_ewma_time": 0.0,  # time.monotonic() of the last observation
+                "saturated": False      # Worker's admission queue is full, skipped until it drains
             })
+            update_policy_state(worker)
+            publish_snapshot()
 
         response_obj = lb_pb2.RegisterWorkerResponse()
         response_obj.err_code = 0
         response_obj.msg = "Worker Registered Successfully"
-        logging.info(f"Worker {request.id} registered successfully")
+        logging.info(f"Worker {request.id} registered successfully with capacity {worker['capacity']}")
         return response_obj
 
     def GetServer(self, request, context):
-        logging.info("Get Server request received")
+        logging.info("Get Server request received", extra=LOG_GET_SERVER)
+        if request.completions:
+            apply_completions(request.completions)
         response_obj = lb_pb2.GetServerResponse()
-        with workers_lock:
-            if len(workers) == 0:
-                response_obj.err_code = 1
-                response_obj.msg = "No servers available"
-                logging.error("No servers available")
-                return response_obj
-            
-            if my_policy == "rr":
-                servers_checked = 0 # To prevent infinite loop
-                while True:
-                    global rr_last_used_index
-                    rr_last_used_index = (rr_last_used_index + 1) % len(workers)
-                    # We increment the last index used by 1 and consider the new index as 
-                    # the server to send (Take modulus to prevent index out of range)
-                    # If the server is active, we send the server details
-                    if workers[rr_last_used_index]["status"] == "active":
-                        response_obj.ip = workers[rr_last_used_index]["ip"]
-                        response_obj.port = workers[rr_last_used_index]["port"]
-                        response_obj.id = workers[rr_last_used_index]["id"]
-                        response_obj.err_code = 0
-                        response_obj.msg = "Server found"
-                        logging.info(f"Server found with id {response_obj.id}: {response_obj.ip}:{response_obj.port}")
-                        break
-                    # Else we check the next server and increment the number of servers checked
-                    # When the number of servers checked is equal to the number of servers, we 
-                    # break the loop as we have checked all the servers and none are active at the moment
-                    servers_checked += 1
-                    if servers_checked == len(workers):
-                        response_obj.err_code = 1
-                        response_obj.msg = "No servers available"
-                        logging.error("No servers available")
-                        break
-            elif my_policy == "ll":
-                min_load = 100 # We assume the maximum load to be 100% (If all the servers are at 100% we return no servers available)
-                min_load_worker_idx = -1
-
-                # Finding the worker with minimum load
-                for idx, worker in enumerate(workers):
-                    if worker["status"] == "active" and worker["load"] < min_load:
-                        min_load = worker["load"]
-                        min_load_worker_idx = idx
-                # If a worker with minimum load is found, we send the server details
-                if min_load_worker_idx != -1:
-                    response_obj.ip = workers[min_load_worker_idx]["ip"]
-                    response_obj.port = workers[min_load_worker_idx]["port"]
-                    response_obj.id = workers[min_load_worker_idx]["id"]
-                    response_obj.err_code = 0
-                    response_obj.msg = "Server found"
-                    logging.info(f"Server found with id {response_obj.id}: {response_obj.ip}:{response_obj.port}")
-                else:
-                    response_obj.err_code = 1
-                    response_obj.msg = "No servers available"
-                    logging.error("No servers available")
-            elif my_policy == "pf":
-                for worker in workers:
-                    if worker["status"] == "active":
-                        response_obj.ip = worker["ip"]
-                        response_obj.port = worker["port"]
-                        response_obj.id = worker["id"]
-                        response_obj.err_code = 0
-                        response_obj.msg = "Server found"
-                        logging.info(f"Server found with id {response_obj.id}: {response_obj.ip}:{response_obj.port}")
-                        break
-                else:
-                    response_obj.err_code = 1
-                    response_obj.msg = "No servers available"
-                    logging.error("No servers available")
+        # Lock free, selection only reads the current snapshot
+        worker = select_worker(worker_snapshot, request.key)
+        if worker is None:
+            response_obj.err_code = 1
+            response_obj.msg = "No servers available"
+            logging.error("No servers available")
+        else:
+            response_obj.ip = worker["ip"]
+            response_obj.port = worker["port"]
+            response_obj.id = worker["id"]
+            response_obj.err_code = 0
+            response_obj.msg = "Server found"
+            logging.info("Server found with id %d: %s:%d", worker["id"], worker["ip"], worker["port"], extra=LOG_GET_SERVER)
+            worker["assigned"] += 1
+        return response_obj
+
+    def GetServers(self, request, context):
+        logging.info("Get Servers request received for %d assignments", request.count, extra=LOG_GET_SERVERS)
+        if request.prev_lease_id:
+            settle_lease(request.prev_lease_id, request.prev_usage)
+        if request.completions:
+            apply_completions(request.completions)
+
+        response_obj = lb_pb2.GetServersResponse()
+        # Run the active policy once per leased assignment, so the lease is spread the
+        # same way the individual GetServer calls would have been
+        snapshot = worker_snapshot
+        count = max(1, min(request.count, MAX_LEASE_SIZE))
+        picks = Counter()
+        for _ in range(count):
+            worker = select_worker(snapshot)
+            if worker is None:
+                break
+            picks[worker["id"]] += 1
+
+        if len(picks) == 0:
+            response_obj.err_code = 1
+            response_obj.msg = "No servers available"
+            logging.error("No servers available")
             return response_obj
 
-    
+        lease_id = next(lease_counter)
+        now = time.monotonic()
+        with leases_lock:
+            # Leases whose client never came back are dropped
+            for expired_id in [l_id for l_id, (expiry, _) in leases.items() if expiry < now]:
+                del leases[expired_id]
+            leases[lease_id] = (now + 2 * lease_ttl, dict(picks))
+
+        total = sum(picks.values())
+        for worker_id, n_picks in picks.items():
+            worker = snapshot.by_id[worker_id]
+            response_obj.servers.add(ip=worker["ip"], port=worker["port"], id=worker_id, weight=n_picks / total)
+        response_obj.lease_id = lease_id
+        response_obj.lease_ttl = lease_ttl
+        response_obj.err_code = 0
+        response_obj.msg = "Servers found"
+        logging.info("Lease %d granted: %s", lease_id, picks, extra=LOG_GET_SERVERS)
+        return response_obj
+
+    def WatchWorkers(self, request, context):
+        watch = WorkerWatch.open()
+        if watch is None:
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Too many watchers")
+        try:
+            while context.is_active():
+                worker_set, version, timeout = watch.poll()
+                if worker_set is not None:
+                    yield worker_set
+                    continue
+                # Wakes up on the next change, the timeout also notices a closed stream
+                worker_feed.wait(version, min(timeout, 1.0))
+        finally:
+            watch.close()
+
+
+# Proxy mode: the LB serves the Worker service itself and forwards every Compute
+# call to a worker picked by the active policy, so clients need a single hop
+class WorkerProxyServicer(worker_grpc.WorkerServicer):
+    def Compute(self, request, context):
+        worker = select_proxy_target(request)
+        if worker is None:
+            return worker_pb2.ComputeResponse(err_code=1, msg="No servers available", result=-1)
+        try:
+            with forwarded_call(worker, backend_pool) as stub:
+                return stub.Compute(request, timeout=remaining_time(context))
+        except grpc.RpcError as e:
+            # Pass the failure on to the client
+            context.abort(e.code(), f"Worker {worker['id']} failed: {e.details()}")
+
+
 class LoadListenerServicer(lb_grpc.LoadListenerServicer):
     def ReportLoad(self, request, context):
-        logging.info(f"Load reported from worker {request.id} = {request.load}%")
-        with workers_lock:
-            for worker in workers:
-                if worker["id"] == request.id:
-                    worker["load"] = request.load
-                    try:
-                        loads[request.id].append(request.load)
-                    except KeyError:
-                        loads[request.id] = [request.load]
-                    break
+        logging.info("Load reported from worker %d = %s%%", request.id, request.load, extra=LOG_LOAD_REPORT)
+        apply_load_report(request)
         
         response_obj = lb_pb2.ReportLoadResponse()
         response_obj.err_code = 0
         response_obj.msg = "Load reported successfully"
         return response_obj
 
+    def StreamLoad(self, request_iterator, context):
+        stream = LoadStream()
+        yield stream.opened()
+        try:
+            for request in request_iterator:
+                response = stream.handle(request)
+                if response is not None:
+                    yield response
+        finally:
+            stream.close()
+
+    def SetReportInterval(self, request, context):
+        global my_report_interval
+        if request.interval <= 0:
+            return lb_pb2.StreamLoadResponse(err_code=1, msg="Interval must be positive", interval=my_report_interval)
+        my_report_interval = request.interval
+        logging.info(f"Report interval set to {my_report_interval}s")
+        return lb_pb2.StreamLoadResponse(err_code=0, msg="Report interval changed", interval=my_report_interval)
+
+
+# Built-in registry (--registry=lb://...), the other processes register and look up services here
+class RegistryServicer(lb_grpc.RegistryServicer):
+    def Register(self, request, context):
+        logging.info(f"Service {request.service.id} ({request.service.name}) registered at port {request.service.port}")
+        # Not passing until the service proves it is alive (for workers: opens its load stream)
+        registry.add(lb_pb2.ServiceEntry(name=request.service.name, id=request.service.id, address=request.service.address, port=request.service.port, passing=False))
+        return lb_pb2.RegistryResponse(err_code=0, msg="Service registered")
+
+    def Deregister(self, request, context):
+        logging.info(f"Service {request.id} deregistered")
+        registry.deregister(request.id)
+        return lb_pb2.RegistryResponse(err_code=0, msg="Service deregistered")
+
+    def Lookup(self, request, context):
+        return lb_pb2.LookupResponse(err_code=0, msg="Success", services=registry.entries(request.name))
+
+
+# ============================= ASYNCIO SERVICERS =============================
+# grpc.aio versions of the servicers (--server=aio). Selection and bookkeeping never
+# block, so they reuse the threaded code; the difference is that every call and every
+# load stream is a coroutine on one event loop instead of holding a pool thread.
+class AioLBServicer(lb_grpc.LBServicer):
+    def __init__(self):
+        self.servicer = LBServicer()
+
+    async def RegisterWorker(self, request, context):
+        return self.servicer.RegisterWorker(request, context)
+
+    async def GetServer(self, request, context):
+        return self.servicer.GetServer(request, context)
+
+    async def GetServers(self, request, context):
+        return self.servicer.GetServers(request, context)
+
+    # Same as LBServicer.WatchWorkers, waiting on the event loop instead of a thread.
+    # The generator is cancelled when the client goes away or the server stops, which
+    # only ends the stream (grpc.aio logs an unhandled CancelledError otherwise).
+    async def WatchWorkers(self, request, context):
+        watch = WorkerWatch.open()
+        if watch is None:
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Too many watchers")
+        try:
+            while True:
+                worker_set, version, timeout = watch.poll()
+                if worker_set is not None:
+                    yield worker_set
+                    continue
+                await worker_feed.wait_async(version, None if timeout == math.inf else timeout)
+        except asyncio.CancelledError:
+            return
+        finally:
+            watch.close()
+
+
+class AioWorkerProxyServicer(worker_grpc.WorkerServicer):
+    async def Compute(self, request, context):
+        worker = select_proxy_target(request)
+        if worker is None:
+            return worker_pb2.ComputeResponse(err_code=1, msg="No servers available", result=-1)
+        try:
+            with forwarded_call(worker, aio_backend_pool) as stub:
+                return await stub.Compute(request, timeout=remaining_time(context))
+        except grpc.RpcError as e:
+            await context.abort(e.code(), f"Worker {worker['id']} failed: {e.details()}")
+
+
+class AioLoadListenerServicer(lb_grpc.LoadListenerServicer):
+    def __init__(self):
+        self.servicer = LoadListenerServicer()
+
+    async def ReportLoad(self, request, context):
+        return self.servicer.ReportLoad(request, context)
+
+    async def SetReportInterval(self, request, context):
+        return self.servicer.SetReportInterval(request, context)
+
+    # Cancelled like WatchWorkers when the worker goes away or the server stops
+    async def StreamLoad(self, request_iterator, context):
+        stream = LoadStream()
+        yield stream.opened()
+        try:
+            async for request in request_iterator:
+                response = stream.handle(request)
+                if response is not None:
+                    yield response
+        except asyncio.CancelledError:
+            return
+        finally:
+            stream.close()
+
+
+class AioRegistryServicer(lb_grpc.RegistryServicer):
+    def __init__(self):
+        self.servicer = RegistryServicer()
+
+    async def Register(self, request, context):
+        return self.servicer.Register(request, context)
+
+    async def Deregister(self, request, context):
+        return self.servicer.Deregister(request, context)
+
+    async def Lookup(self, request, context):
+        return self.servicer.Lookup(request, context)
+
 
 # ============================= SIGNAL HANDLER =============================
 def shutdown_handler(signum, frame):
     logging.info("Shutting down server... Saving load data.")
-    with open("./test_files/load.json", "w") as f:
-        json.dump(loads, f)
-    logging.info("Load data saved successfully.")
+    # Cancels open load streams, otherwise their threads keep the process alive
+    for grpc_server in (server, ll_server):
+        if grpc_server is not None:
+            grpc_server.stop(0)
+    save_load_data()
     sys.exit(0)
 
+async def shutdown_aio():
+    logging.info("Shutting down server... Saving load data.")
+    # Unary calls (e.g. forwarded Compute calls) get a moment to finish, open streams are cancelled
+    await asyncio.gather(server.stop(SHUTDOWN_GRACE_SEC), ll_server.stop(SHUTDOWN_GRACE_SEC))
+    save_load_data()
+
+def save_load_data():
+    logging.info(workers_lock_metric.summary())
+    logging.info(f"Requests routed per worker: { {worker['id']: worker['assigned'] for worker in worker_snapshot.workers} }")
+    if my_mode == "proxy":
+        logging.info(f"Proxied latency peak EWMA per worker (s): { {worker['id']: worker['peak_ewma'] for worker in worker_snapshot.workers} }")
+    # Load summary per worker from load_history: the raw samples and the downsampled buckets before them
+    for worker_id, history in sorted(load_history.items()):
+        stats = history.window(None)
+        if stats is None:
+            continue
+        low, avg, high, count = stats
+        buckets = history.buckets()
+        older = ""
+        if buckets:
+            older = (f", before that min {min(b[1] for b in buckets):.2f}, max {max(b[3] for b in buckets):.2f}"
+                     f" over {len(buckets)} buckets of {history_bucket_sec:g}s")
+        logging.info(f"Worker {worker_id} load: min {low:.2f}, avg {avg:.2f}, max {high:.2f} over the last {count} reports{older}")
+    # Records are written as they arrive, only the last batch is left to flush
+    if metrics_log is not None:
+        metrics_log.close()
+        logging.info(f"Load log: {metrics_log.written} records written, {metrics_log.dropped} dropped")
+    logging.info("Load data saved successfully.")
+
 # Register signal handlers for graceful shutdown
 signal.signal(signal.SIGINT, shutdown_handler)  # Handle Ctrl+C
 signal.signal(signal.SIGTERM, shutdown_handler)  # Handle termination signals
 
 
 # ============================= FUNCTIONS =============================
-# --------------------------------------------------------------------------------
-# Code from ChatGPT (Prompt 1)
-# --------------------------------------------------------------------------------
-def get_available_workers():
-    response = requests.get("http://localhost:8500/v1/catalog/service/worker").json()
-    return [(service['ServiceAddress'], service['ServicePort']) for service in response]
-
-def get_alive_workers():
-    response = requests.get(CONSUL_URL_WORKER).json()
-    
-    alive_servers = []
-    for service in response:
-        status = service["Checks"][0]["Status"]  # Get health check status
-        if status == "passing":  # "passing" means the server is alive
-            address = service["Service"]["Address"]
-            port = service["Service"]["Port"]
-            alive_servers.append((address, port))
-
-    return alive_servers
-# --------------------------------------------------------------------------------
-
-
-# ============================= THREADS =============================
-def health_check():
-    while True:
-        time.sleep(WAIT_TIME_SEC)  # Wait for the specified interval
-
-        with workers_lock:  # Lock while accessing shared list
-            alive_servers = get_alive_workers()
-            addresses = []
-            ports = []
-            for address, port in alive_servers:
-                addresses.append(address)
-                ports.append(port)
-            
-            for worker in workers:
-                if worker["port"] in ports:
-                    worker["status"] = "active"
-                else:
-                    worker["status"] = "inactive"
+# Applies what a client reports it actually sent with a lease: the granted assignments
+# were already counted as outstanding, so only the difference is corrected
+def settle_lease(lease_id, usage):
+    with leases_lock:
+        lease = leases.pop(lease_id, None)
+    granted = lease[1] if lease is not None else {}
+    with timed_lock(workers_lock, workers_lock_metric):
+        for used in usage:
+            worker = workers_by_id.get(used.id)
+            if worker is None:
+                continue
+            worker["assigned"] += used.count
+            add_provisional(worker, used.count - granted.get(used.id, 0))
+
+# Records a load report from a worker (unary or streamed)
+def apply_load_report(request):
+    history = None
+    with timed_lock(workers_lock, workers_lock_metric):
+        worker = workers_by_id.get(request.id)
+        if worker is not None:
+            worker["load"] = request.load
+            worker["cpu_ewma"] = request.cpu_ewma
+            worker["in_flight"] = request.in_flight
+            worker["queue_depth"] = request.queue_depth
+            # The reported load now reflects the work we assigned before the report
+            worker["outstanding"] = 0
+            if my_mode != "proxy":
+                worker["ring_pending"] = 0
+            update_score(worker)
+            track_ring_load(worker)
+            if worker["saturated"] != request.saturated:
+                worker["saturated"] = request.saturated
+                logging.info(f"Worker {request.id} {'saturated' if request.saturated else 'drained'}")
+                update_policy_state(worker)
+                publish_snapshot()
+            history = load_history.get(request.id)
+            if history is None:
+                history = LoadHistory(capacity=history_size, bucket_sec=history_bucket_sec)
+                load_history[request.id] = history
+            if metrics_log is not None:
+                metrics_log.append(request.id, request.load, request.in_flight)
+            worker_feed.bump()
+    # LoadHistory has its own lock, no need to hold workers_lock for the append
+    if history is not None:
+        history.append(request.load)
+
+# Recomputes the composite load score of a worker (see ll_weights) and moves it in
+# ll_heap (must be called with workers_lock held). In proxy mode the LB's own exact
+# in-flight count replaces the one last reported by the worker, otherwise the heap
+# also counts the provisional load (as of its last update, workers that get no new
+# assignments keep a slightly high estimate until their next report).
+def update_score(worker):
+    cpu_weight, in_flight_weight, queue_weight = ll_weights
+    in_flight = worker["proxy_in_flight"] if my_mode == "proxy" else worker["in_flight"]
+    worker["score"] = (cpu_weight * worker["cpu_ewma"]
+                       + in_flight_weight * in_flight
+                       + queue_weight * worker["queue_depth"])
+    if worker["id"] in ll_heap:
+        ll_heap.update(worker["id"], ll_priority(worker))
+
+def ll_priority(worker):
+    if my_mode == "proxy":
+        return worker["score"]
+    return worker["score"] + ll_weights[1] * worker["outstanding"]
+
+# Seconds until a watcher should get the next WorkerSet, 0 to send it now: right away when
+# membership or status changed (new snapshot), after watch_interval for load-only changes
+def watch_update_due(snapshot, sent_snapshot, version, sent_version, sent_time):
+    if snapshot is not sent_snapshot:
+        return 0
+    if version == sent_version:
+        return math.inf
+    return max(0, watch_interval - (time.monotonic() - sent_time))
+
+def make_worker_set(snapshot, version):
+    worker_set = lb_pb2.WorkerSet(version=version)
+    for worker in snapshot.active:
+        worker_set.workers.add(id=worker["id"], ip=worker["ip"], port=worker["port"], score=worker["score"],
+                               load=worker["load"], weight=worker["capacity"], in_flight=worker["in_flight"])
+    return worker_set
+
+# Client deadline to pass on to the worker. Without a deadline gRPC reports a time
+# far in the future, which we turn back into "no timeout".
+def remaining_time(context):
+    remaining = context.time_remaining()
+    if remaining is None or remaining > NO_DEADLINE_SEC:
+        return None
+    return remaining
+
+def proxy_call_started(worker):
+    with timed_lock(workers_lock, workers_lock_metric):
+        worker["proxy_in_flight"] += 1
+        # The pick's reservation is now a forwarded call
+        worker["ring_pending"] = max(0, worker["ring_pending"] - 1)
+        update_score(worker)
+        track_ring_load(worker)
+
+def proxy_call_finished(worker, latency, ok):
+    with timed_lock(workers_lock, workers_lock_metric):
+        worker["proxy_in_flight"] -= 1
+        observe_latency(worker, latency, ok)
+        update_score(worker)
+        track_ring_load(worker)
+
+# Proxy mode: worker a forwarded Compute call goes to, None if no worker is available
+def select_proxy_target(request):
+    worker = select_worker(worker_snapshot, routing_key(request.type, request.n))
+    if worker is None:
+        logging.error("No servers available")
+    return worker
+
+# Proxy mode: bookkeeping around one forwarded call (threaded and asyncio), yields the
+# worker's stub from `pool`. The channel stays in use until the worker answers, so idle
+# eviction can't close it under a long call. A failed call is logged and re-raised for the
+# servicer to abort with; the channel is shared with other in-flight calls and reconnects
+# by itself, so it is left open.
+@contextmanager
+def forwarded_call(worker, pool):
+    address = f"{worker['ip']}:{worker['port']}"
+    proxy_call_started(worker)
+    start_time = time.perf_counter()
+    ok = False
+    try:
+        with pool.use(address, worker_grpc.WorkerStub) as stub:
+            yield stub
+        ok = True
+    except grpc.RpcError as e:
+        logging.error(f"Forwarding to worker {worker['id']} failed: {e.code()}")
+        raise
+    finally:
+        proxy_call_finished(worker, time.perf_counter() - start_time, ok)
+    worker["assigned"] += 1
+
+# Finished requests reported by a client (lookaside mode)
+def apply_completions(completions):
+    with timed_lock(workers_lock, workers_lock_metric):
+        for completion in completions:
+            worker = workers_by_id.get(completion.id)
+            if worker is None:
+                continue
+            observe_latency(worker, completion.latency, completion.ok)
+            add_provisional(worker, -1)
+            update_score(worker)
+
+# Feeds one latency observation into the worker's peak EWMA (must be called with workers_lock held)
+def observe_latency(worker, latency, ok):
+    now = time.monotonic()
+    if not ok:
+        latency = max(latency, EWMA_PENALTY_SEC)
+    if latency > worker["peak_ewma"]:
+        worker["peak_ewma"] = latency
+    else:
+        weight = math.exp(-(now - worker["peak_ewma_time"]) / ewma_decay_sec)
+        worker["peak_ewma"] = worker["peak_ewma"] * weight + latency * (1 - weight)
+    worker["peak_ewma_time"] = now
+
+# Cost of sending one more request to the worker under the ewma policy. Lock free, the
+# average decays towards 0 while a worker gets no observations so it is tried again.
+def ewma_cost(worker, now):
+    pending = estimated_in_flight(worker)
+    ewma = worker["peak_ewma"] * math.exp(-(now - worker["peak_ewma_time"]) / ewma_decay_sec)
+    if ewma == 0 and pending > 0:
+        ewma = EWMA_PENALTY_SEC
+    return ewma * (pending + 1)
+
+# Workers that can be given new requests: healthy and not saturated
+def is_available(worker):
+    return worker["status"] == "active" and not worker["saturated"]
+
+# Keeps ll_heap, wrr and ring in sync with a worker entry (must be called with workers_lock held).
+# Saturated workers stay on the ring, so a short saturation doesn't remap their keys.
+def update_policy_state(worker):
+    if is_available(worker):
+        ll_heap.push(worker["id"], ll_priority(worker))
+        wrr.set(worker["id"], worker["capacity"])
+    else:
+        ll_heap.remove(worker["id"])
+        wrr.remove(worker["id"])
+    if worker["status"] == "active":
+        ring.add(worker["id"])
+    else:
+        ring.remove(worker["id"])
+    track_ring_load(worker)
+
+# ring policy: refreshes the number of requests the worker holds as far as the LB knows
+# (forwarded calls in proxy mode, otherwise the reported in-flight count, plus the picks
+# not reflected in those yet) and its share of ring_load_total. A whole count, so the
+# bound is not undercut by decay. Must be called with workers_lock held.
+def track_ring_load(worker):
+    global ring_load_total
+    if my_policy != "ring":
+        return
+    in_flight = worker["proxy_in_flight"] if my_mode == "proxy" else worker["in_flight"]
+    load = in_flight + worker["ring_pending"]
+    counted = is_available(worker)
+    ring_load_total += (load if counted else 0) - (worker["ring_load"] if worker["ring_counted"] else 0)
+    worker["ring_load"] = load
+    worker["ring_counted"] = counted
+
+# Requests a worker is holding as far as the LB knows (ewma policy): in proxy mode
+# the exact forwarded count, otherwise the reported in-flight count plus assignments since that report
+def estimated_in_flight(worker):
+    if my_mode == "proxy":
+        return worker["proxy_in_flight"]
+    return worker["in_flight"] + provisional_load(worker, time.monotonic())
+
+def provisional_load(worker, now):
+    expected_job_sec = worker["peak_ewma"] or ll_job_sec
+    return worker["outstanding"] * math.exp(-(now - worker["outstanding_time"]) / expected_job_sec)
+
+# Must be called with workers_lock held: concurrent picks would otherwise lose increments
+# of the read-modify-write, exactly in the bursts the provisional load is meant to spread
+def add_provisional(worker, amount):
+    now = time.monotonic()
+    worker["outstanding"] = max(0.0, provisional_load(worker, now) + amount)
+    worker["outstanding_time"] = now
+    worker["ring_pending"] = max(0, worker["ring_pending"] + amount)
+    track_ring_load(worker)
+
+# Publishes a new immutable view of the worker table (must be called with workers_lock held).
+# Only membership, status and saturation changes need this, so the O(n) copy is off the request path.
+def publish_snapshot():
+    global worker_snapshot
+    active = tuple(worker for worker in workers if is_available(worker))
+    worker_snapshot = WorkerSnapshot(tuple(workers), dict(workers_by_id), active)
+    worker_feed.bump()
+
+
+# ============================= POLICIES =============================
+# Picks a worker for a request from `snapshot` according to my_policy, None if
+# no worker is available. rr, wrr and pf are lock free, the others take workers_lock
+# to record the provisional load. `key` is the request's routing key (only used by ring,
+# empty for none).
+def select_worker(snapshot, key=""):
+    active = snapshot.active
+    if len(active) == 0:
+        return None
+
+    if my_policy == "rr":
+        # Only available workers are in the snapshot, so the cursor can never land on an inactive or saturated one
+        return active[next(rr_counter) % len(active)]
+    elif my_policy == "wrr":
+        # Smooth weighted round-robin over the available workers, weighted by declared capacity
+        worker_id = wrr.pick()
+        return snapshot.by_id.get(worker_id) if worker_id is not None else None
+    elif my_policy == "ll":
+        # Active workers are kept in ll_heap ordered by load score plus provisional load,
+        # the least loaded one is at the top. In proxy mode the forwarded call itself
+        # raises the score (proxy_call_started).
+        if my_mode == "proxy":
+            top = ll_heap.peek()
+            if top is None or (ll_max_score is not None and top[0] >= ll_max_score):
+                return None
+            return snapshot.by_id.get(top[1])
+        with timed_lock(workers_lock, workers_lock_metric):
+            top = ll_heap.peek()
+            if top is None or (ll_max_score is not None and top[0] >= ll_max_score):
+                return None
+            worker = workers_by_id.get(top[1])
+            if worker is not None:
+                add_provisional(worker, 1)
+                update_score(worker)
+            return worker
+    elif my_policy == "p2c":
+        # Sample two random active workers and pick the one with less load, counting
+        # the assignments we have made since their last report as extra load
+        if len(active) == 1:
+            worker = active[0]
+        else:
+            first, second = random.sample(active, 2)
+            now = time.monotonic()
+            first_score = first["score"] + provisional_load(first, now) * P2C_OUTSTANDING_WEIGHT
+            second_score = second["score"] + provisional_load(second, now) * P2C_OUTSTANDING_WEIGHT
+            worker = first if first_score <= second_score else second
+        # The choice is lock free, only the bookkeeping takes workers_lock
+        with timed_lock(workers_lock, workers_lock_metric):
+            add_provisional(worker, 1)
+        return worker
+    elif my_policy == "ewma":
+        # p2c on peak EWMA latency x pending requests
+        if len(active) == 1:
+            worker = active[0]
+        else:
+            now = time.monotonic()
+            first, second = random.sample(active, 2)
+            worker = first if ewma_cost(first, now) <= ewma_cost(second, now) else second
+        # Lowered again by the client's completion report
+        with timed_lock(workers_lock, workers_lock_metric):
+            add_provisional(worker, 1)
+        return worker
+    elif my_policy == "ring":
+        # Bound from "Consistent Hashing with Bounded Loads" (Mirrokni et al.), counting
+        # this request. Requests without a key start at a random point of the ring. The
+        # check and the assignment happen under workers_lock, otherwise concurrent picks
+        # would all see the same worker under the bound.
+        with timed_lock(workers_lock, workers_lock_metric):
+            bound = math.ceil((1 + ring_epsilon) * (ring_load_total + 1) / len(active))
+            def is_eligible(worker_id):
+                worker = workers_by_id.get(worker_id)
+                return worker is not None and worker["ring_counted"] and worker["ring_load"] < bound
+            worker_id = ring.lookup(key or None, is_eligible)
+            if worker_id is None:
+                return None
+            worker = workers_by_id[worker_id]
+            add_provisional(worker, 1)
+            return worker
+    elif my_policy == "pf":
+        # Snapshot keeps registration order
+        return active[0]
+    return None
+
+
+# ============================= HEALTH WATCH =============================
+# Called by the registry with the {port: "active" / "inactive"} map of the workers as
+# soon as it changes (Consul: from the blocking query watcher, built-in registry: from
+# the call that changed it). workers_lock is only held to apply the map.
+def on_worker_health_change(health):
+    global worker_health
+    worker_health = health
+
+    with timed_lock(workers_lock, workers_lock_metric):
+        for worker in workers:
+            status = health.get(worker["port"], "inactive")
+            if worker["status"] != status:
+                worker["status"] = status
+                update_policy_state(worker)
+        publish_snapshot()
+    logging.info(f"Worker health updated: {health}")
+    logging.info(workers_lock_metric.summary())
+
+
+# ============================= SERVERS =============================
+def serve_threads(args):
+    global server, ll_server, health_watch
+
+    # Starting load balancing server
+    # In proxy mode every forwarded call holds a thread until the worker answers
+    max_threads = args.proxy_threads if my_mode == "proxy" else 10
+    # Every WatchWorkers stream holds a thread as well
+    max_threads += args.max_watchers
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_threads))
+    lb_grpc.add_LBServicer_to_server(LBServicer(), server)
+    if my_mode == "proxy":
+        worker_grpc.add_WorkerServicer_to_server(WorkerProxyServicer(), server)
+    if isinstance(registry, LocalRegistry):
+        lb_grpc.add_RegistryServicer_to_server(RegistryServicer(), server)
+    server.add_insecure_port(f"localhost:{my_port}")
+    server.start()
+    logging.info(f"Load Balancing server started at port {my_port} in {my_mode} mode")
+
+    # Start watching worker health (Consul blocking queries or built-in registry changes, no fixed polling interval)
+    health_watch = registry.watch_health("worker", on_worker_health_change)
+    logging.info("Health watch started")
+
+    # Starting load listening server (every open load stream holds one thread)
+    ll_server = grpc.server(futures.ThreadPoolExecutor(max_workers=args.max_load_streams + 10))
+    lb_grpc.add_LoadListenerServicer_to_server(LoadListenerServicer(), ll_server)
+    ll_server.add_insecure_port(f"localhost:{my_port + 1}")
+    ll_server.start()
+    logging.info(f"Load Listener server started at port {my_port + 1}")
+
+    # Waiting for termination
+    server.wait_for_termination()
+    ll_server.wait_for_termination()
+
+# Both servers and the health watch share one event loop, no thread pools
+async def serve_aio(args):
+    global server, ll_server
+
+    server = grpc.aio.server()
+    lb_grpc.add_LBServicer_to_server(AioLBServicer(), server)
+    if my_mode == "proxy":
+        worker_grpc.add_WorkerServicer_to_server(AioWorkerProxyServicer(), server)
+    if isinstance(registry, LocalRegistry):
+        lb_grpc.add_RegistryServicer_to_server(AioRegistryServicer(), server)
+    server.add_insecure_port(f"localhost:{my_port}")
+    await server.start()
+    logging.info(f"Load Balancing server (asyncio) started at port {my_port} in {my_mode} mode")
+
+    ll_server = grpc.aio.server()
+    lb_grpc.add_LoadListenerServicer_to_server(AioLoadListenerServicer(), ll_server)
+    ll_server.add_insecure_port(f"localhost:{my_port + 1}")
+    await ll_server.start()
+    logging.info(f"Load Listener server (asyncio) started at port {my_port + 1}")
+
+    health_task = asyncio.create_task(registry.watch_health_async("worker", on_worker_health_change))
+    logging.info("Health watch task started")
+
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, lambda: asyncio.ensure_future(shutdown_aio()))
+
+    # Waiting for termination
+    await asyncio.gather(server.wait_for_termination(), ll_server.wait_for_termination())
+    health_task.cancel()
 
 
 # ============================= MAIN =============================
@@ -209,96 +916,76 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Load Balancer')
     parser.add_argument("--port", type=int, default=50051, help="Port Number for Load Balancer")
     parser.add_argument("--interval", type=int, default=10, help="Interval for Health Check")
-    parser.add_argument("--policy", type=str, default="rr", help="Policy for Load Balancer") # Values = Round-Robin (rr), Least-Loaded (ll), Pick-First (pf)
+    parser.add_argument("--policy", type=str, default="rr", choices=["rr", "wrr", "ll", "pf", "p2c", "ring", "ewma"], help="Policy for Load Balancer") # Values = Round-Robin (rr), Weighted Round-Robin (wrr), Least-Loaded (ll), Pick-First (pf), Power-of-Two-Choices (p2c), Consistent Hashing (ring), Peak EWMA latency (ewma)
+    parser.add_argument("--report_interval", type=float, default=None, help="Load reporting interval pushed to workers in seconds (default: --interval)")
+    parser.add_argument("--max_load_streams", type=int, default=128, help="Maximum number of workers streaming load reports at once")
+    parser.add_argument("--max_watchers", type=int, default=128, help="Maximum number of clients watching the worker set (WatchWorkers) at once")
+    parser.add_argument("--watch_interval", type=float, default=None, help="Minimum seconds between two load-only updates pushed to WatchWorkers clients (default: --report_interval)")
+    parser.add_argument("--ll_weights", type=str, default="1,10,10", help="Weights of CPU EWMA, in-flight requests and queue depth in the load score")
+    parser.add_argument("--ll_max_score", type=float, default=None, help="Least-Loaded returns no server once the lowest load score reaches this")
+    parser.add_argument("--ring_vnodes", type=int, default=100, help="Virtual nodes per worker on the ring policy's hash ring")
+    parser.add_argument("--ring_epsilon", type=float, default=0.25, help="Ring policy: no worker takes more than (1 + epsilon) times the average number of requests")
+    parser.add_argument("--ewma_decay", type=float, default=10.0, help="Ewma policy: seconds over which an old latency observation fades")
+    parser.add_argument("--ll_job_time", type=float, default=1.0, help="Seconds an assignment counts as provisional load before the worker's latency is known")
+    parser.add_argument("--mode", type=str, default="lookaside", choices=["lookaside", "proxy"], help="lookaside: clients ask for a worker, proxy: the LB forwards Compute calls to workers")
+    parser.add_argument("--proxy_threads", type=int, default=100, help="Proxy mode: maximum number of concurrently forwarded calls")
+    parser.add_argument("--lease_ttl", type=float, default=1.0, help="Seconds a GetServers lease stays valid")
+    parser.add_argument("--server", type=str, default="threads", choices=["threads", "aio"], help="threads: gRPC thread pool servers, aio: grpc.aio servers on one event loop")
+    parser.add_argument("--history_size", type=int, default=3600, help="Load samples kept per worker at full resolution")
+    parser.add_argument("--history_bucket", type=float, default=60.0, help="Seconds per min/avg/max bucket older samples are downsampled to")
+    parser.add_argument("--load_log", type=str, default="./test_files/load_log", help="Directory of the binary load log, empty to disable")
+    parser.add_argument("--load_log_segment", type=int, default=1_000_000, help="Load records per log segment before rotating")
+    parser.add_argument("--registry", type=str, default=DEFAULT_REGISTRY, help="consul://host:port, or lb://localhost:<port> to serve a built-in registry from this LB (no Consul agent needed)")
+    parser.add_argument("--log_format", type=str, default="text", choices=["text", "json"], help="lb.log format, json writes one JSON object per line")
+    parser.add_argument("--log_sample", type=str, default="", help="Fraction of per-request log messages kept by type, e.g. get_server=0.01,load_report=0.1")
+    parser.add_argument("--log_rate", type=str, default="get_server=100,get_servers=100", help="Maximum per-request log messages per second by type (types: get_server, get_servers, load_report)")
     args = parser.parse_args()
 
     my_port = args.port
     my_interval = args.interval
     my_policy = args.policy
-
-    logging.basicConfig(
-        filename=f"./server/logs/lb.log",
+    my_mode = args.mode
+    my_report_interval = args.report_interval if args.report_interval is not None else float(my_interval)
+    ll_weights = tuple(float(weight) for weight in args.ll_weights.split(","))
+    if len(ll_weights) != 3:
+        parser.error("--ll_weights needs three comma separated values")
+    ll_max_score = args.ll_max_score
+    ll_job_sec = args.ll_job_time
+    watch_interval = args.watch_interval if args.watch_interval is not None else my_report_interval
+    watch_slots = threading.BoundedSemaphore(args.max_watchers)
+    ring = ConsistentHashRing(vnodes=args.ring_vnodes)
+    ring_epsilon = args.ring_epsilon
+    ewma_decay_sec = args.ewma_decay
+    lease_ttl = args.lease_ttl
+    history_size = args.history_size
+    history_bucket_sec = args.history_bucket
+    if args.load_log:
+        metrics_log = MetricsLogWriter(args.load_log, segment_records=args.load_log_segment, reset=True)
+
+    # Log lines are written by a background thread, per-request messages can be sampled / rate limited
+    setup_logging(
+        "./server/logs/lb.log",
         level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s"
+        log_format=args.log_format,
+        sample_rates=parse_log_limits(args.log_sample),
+        rate_limits=parse_log_limits(args.log_rate)
     )
 
-    # Starting the Load Balancer server
-    data = {
-        "service": {
-            "name": "load-balancer",
-            "id": "lb",
-            "port": my_port,
-            "check": {
-                "http": f"http://localhost:{my_port}/health",
-                "interval": f"{my_interval}s"
-            }
-        }
-    }
-
-    # Creating a consul service definition file
-    with open("./server/lb.json", "w") as json_file:
-        json.dump(data, json_file)
-    logging.info("Load Balancer service definition file created")
-
-    # Registering the service with consul
-    command = ["consul", "services", "register", "./server/lb.json"]
+    # Registering the Load Balancer and the Load Listener
+    registry = create_registry(args.registry, local=True)
+    set_registry(registry)
     try:
-        result = subprocess.run(command, check=True)
-        logging.info("Load Balancer service registered with consul")
-    except subprocess.CalledProcessError as e:
+        registry.register("load-balancer", "lb", my_port, my_interval)
+        logging.info("Load Balancer service registered")
+        registry.register("load-listener", "ll", my_port + 1, my_interval)
+        logging.info("Load Listener service registered")
+    except requests.RequestException as e:
         logging.error(f"Error registering service: {e}")
-        logging.error("Error registering load balancer service")
         sys.exit(1)
 
-    # Starting load balancing server
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    lb_grpc.add_LBServicer_to_server(LBServicer(), server)
-    server.add_insecure_port(f"localhost:{my_port}")
-    server.start()
-    logging.info(f"Load Balancing server started at port {my_port}")
-
-    # Start the health check thread
-    health_thread = threading.Thread(target=health_check, daemon=True)
-    health_thread.start()
-    logging.info("Health check thread started")
-
-    # Starting the Load listener server
-    load_listener_data = {
-        "service": {
-            "name": "load-listener",
-            "id": "ll",
-            "port": my_port + 1,
-            "check": {
-                "http": f"http://localhost:{my_port + 1}/health",
-                "interval": f"{my_interval}s"
-            }
-        }
-    }
-
-    # Creating a consul service definition file
-    with open("./server/ll.json", "w") as json_file:
-        json.dump(load_listener_data, json_file)
-    logging.info("Load Listener service definition file created")
-
-    # Registering the service with consul
-    command = ["consul", "services", "register", "./server/ll.json"]
-    try:
-        result = subprocess.run(command, check=True)
-        logging.info("Load Listener service registered with consul")
-    except subprocess.CalledProcessError as e:
-        logging.error(f"Error registering service: {e}")
-        logging.error("Error registering load listener service")
-        sys.exit(1)
-
-    # Starting load listening server
-    ll_server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    lb_grpc.add_LoadListenerServicer_to_server(LoadListenerServicer(), ll_server)
-    ll_server.add_insecure_port(f"localhost:{my_port + 1}")
-    ll_server.start()
-    logging.info(f"Load Listener server started at port {my_port + 1}")
-
     clear_screen()
 
-    # Waiting for termination
-    server.wait_for_termination()
-    ll_server.wait_for_termination()
\ No newline at end of file
+    if args.server == "aio":
+        asyncio.run(serve_aio(args))
+    else:
+        serve_threads(args)
@@ -1,15 +1,18 @@
 # ============================= IMPORTS =============================
 import argparse
+import asyncio
 import requests
-import json
-import subprocess
 import sys
 from concurrent import futures
 import grpc
 import logging
 import threading
 import time
+import math
+import os
 import psutil
+import signal
+from concurrent.futures.process import BrokenProcessPool
 
 sys.path.append("generated")
 import lb_pb2
@@ -19,113 +22,289 @@ import worker_pb2_grpc as worker_grpc
 sys.path.remove("generated")
 
 sys.path.append("utils")
-from utils import get_lb_port, get_ll_port, ComputeType
+from utils import get_lb_port, get_ll_port, worker_service_id, ComputeType
+from registry import create_registry, set_registry, get_registry, DEFAULT_REGISTRY
+from result_cache import ResultCache
+from admission import AdmissionController, AsyncAdmissionController, AdmissionRejected
+from log_pipeline import setup_logging, parse_log_limits
 sys.path.remove("utils")
 
 # ============================= GLOBALS =============================
 my_port = None
 my_id = None
 my_interval = None
+my_capacity = None   # Relative capacity sent to the LB (weight of its wrr policy)
+report_interval = None  # Seconds between load reports, the LB can change it over the stream
+
+MIN_BACKOFF_SEC = 0.5
+MAX_BACKOFF_SEC = 30
+
+CPU_EWMA_TAU_SEC = 5    # Time constant of the CPU moving average
+
+executor = None         # Thread pool running jobs (the gRPC server's, or the CPU job pool with --server=aio), its queue length is reported as queue depth
+servicer = None
+load_sampler = None
+
+# Where jobs run:
+#   threads   - in the gRPC server thread (one core at most because of the GIL)
+#   processes - every job in process_pool
+#   hybrid    - CPU-bound job types in process_pool, the rest in the gRPC thread
+executor_backend = "threads"
+process_pool = None
+process_pool_size = None
+process_pool_lock = threading.Lock()    # Serialises replacing a broken process pool
+
+result_cache = None     # Results of the job types in cached_jobs, keyed by (type, n)
+cached_jobs = set()
+
+admission = None        # Admission queue limiting running Compute requests (--max_concurrent)
+report_wakeup = None    # Set to send a load report right away (e.g. saturation changed)
+
+LOG_COMPUTE = {"log_type": "compute"}   # Per-request log messages, see --log_sample / --log_rate
 
 # ============================= CLASSES =============================
 class WorkerServicer(worker_grpc.WorkerServicer):
+    def __init__(self):
+        self.in_flight = 0      # Compute requests currently being handled
+        self.in_flight_lock = threading.Lock()
+
     def Compute(self, request, context):
-        logging.info(f"Received Compute request of type {request.type} with n = {request.n}")
-        response_obj = worker_pb2.ComputeResponse()
-        if request.type == ComputeType.SUM_TO_N.value:
-            result = 0
-            i = 1
-            while i <= request.n:
-                # result += i (Had removed this as it was giving out of bound error)
-                result = result + 1
-                i += 1
-            response_obj.err_code = 0
-            response_obj.msg = "Success"
-            response_obj.result = result
-        elif request.type == ComputeType.SLEEP_FOR_SECONDS.value:
-            time.sleep(request.n)
-            response_obj.err_code = 0
-            response_obj.msg = "Success"
-            response_obj.result = 0
-        else:
-            response_obj.err_code = 1
-            response_obj.msg = "Invalid request type"
-            response_obj.result = -1
-        return response_obj
+        logging.info("Received Compute request of type %d with n = %d", request.type, request.n, extra=LOG_COMPUTE)
+        if admission is None:
+            return self.handle(request)
+        try:
+            with admission.slot():
+                return self.handle(request)
+        except AdmissionRejected as e:
+            logging.warning(f"Rejected Compute request: {e}")
+            context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(e))
 
+    def handle(self, request):
+        with self.in_flight_lock:
+            self.in_flight += 1
+        try:
+            return run_job(request)
+        finally:
+            with self.in_flight_lock:
+                self.in_flight -= 1
 
-# ============================= THREADS =============================
-def report_load():
-    while True:
-        ll_port = get_ll_port()
-        ll_channel = grpc.insecure_channel(f"localhost:{ll_port}")
-        ll_stub = lb_grpc.LoadListenerStub(ll_channel)
-        request_obj = lb_pb2.ReportLoadRequest()
 
+# --server=aio: jobs that only wait (SLEEP_FOR_SECONDS) are awaited on the event loop
+# and cost a timer instead of a thread, the others are sent to an executor
+class AioWorkerServicer(worker_grpc.WorkerServicer):
+    def __init__(self):
+        self.in_flight = 0      # Only touched from the event loop, no lock needed
+
+    async def Compute(self, request, context):
+        logging.info("Received Compute request of type %d with n = %d", request.type, request.n, extra=LOG_COMPUTE)
+        if admission is None:
+            return await self.handle(request)
+        try:
+            async with admission.slot():
+                return await self.handle(request)
+        except AdmissionRejected as e:
+            logging.warning(f"Rejected Compute request: {e}")
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(e))
+
+    async def handle(self, request):
+        self.in_flight += 1
+        try:
+            return await run_job_async(request)
+        finally:
+            self.in_flight -= 1
+
+
+# Thread pool that counts the tasks submitted but not started yet (the length of its queue),
+# reported as queue depth. With the sync server these are RPCs waiting for a gRPC thread.
+class QueueCountingExecutor(futures.ThreadPoolExecutor):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.queued = 0
+        self._queued_lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs):
+        self._add_queued(1)
+        try:
+            future = super().submit(self._run, fn, args, kwargs)
+        except BaseException:
+            self._add_queued(-1)
+            raise
+        # A task cancelled before it started never runs _run
+        future.add_done_callback(lambda f: f.cancelled() and self._add_queued(-1))
+        return future
+
+    def _run(self, fn, args, kwargs):
+        self._add_queued(-1)
+        return fn(*args, **kwargs)
+
+    def _add_queued(self, amount):
+        with self._queued_lock:
+            self.queued += amount
+
+
+# Samples the current load without blocking: CPU % since the previous call (folded
+# into a time-based EWMA), in-flight Compute requests and the executor queue length.
+# CPU used by process pool children is included.
+class LoadSampler:
+    def __init__(self):
+        self.process = psutil.Process()
+        self.process.cpu_percent(interval=None)     # First call only sets the baseline
+        self.children = {}  # pid -> psutil.Process, kept so each child has a baseline
+        self.cpu_ewma = 0.0
+        self.last_sample = time.monotonic()
+
+    def children_cpu_percent(self):
+        total = 0.0
+        children = {}
+        for child in self.process.children():
+            child = self.children.get(child.pid, child)
+            try:
+                total += child.cpu_percent(interval=None)   # 0 on the first call for a new child
+            except psutil.NoSuchProcess:
+                continue
+            children[child.pid] = child
+        self.children = children
+        return total
+
+    def sample(self):
+        now = time.monotonic()
+        cpu_usage = self.process.cpu_percent(interval=None) + self.children_cpu_percent()
+        alpha = 1 - math.exp(-(now - self.last_sample) / CPU_EWMA_TAU_SEC)
+        self.cpu_ewma += alpha * (cpu_usage - self.cpu_ewma)
+        self.last_sample = now
+
+        request_obj = lb_pb2.ReportLoadRequest()
         request_obj.id = my_id
-        cpu_usage = psutil.Process().cpu_percent(interval=1)
         request_obj.load = cpu_usage
+        request_obj.cpu_ewma = self.cpu_ewma
+        request_obj.in_flight = servicer.in_flight if servicer is not None else 0
+        request_obj.queue_depth = executor.queued if executor is not None else 0
+        if admission is not None:
+            request_obj.queue_depth += admission.waiting
+            request_obj.saturated = admission.saturated
+        return request_obj
 
-        response = ll_stub.ReportLoad(request_obj)
-        if response.err_code == 0:
-            logging.info(f"Load reported to Load Balancer")
-        else:
-            logging.error(response.msg)
-        ll_channel.close()
-        time.sleep(my_interval)
 
-# ============================= MAIN =============================
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description='Worker')
-    parser.add_argument("--port", type=int, help="Port Number for Worker")
-    parser.add_argument("--id", type=int, help="Worker ID")
-    parser.add_argument("--interval", type=int, default=10, help="Interval for Health Check")
-    args = parser.parse_args()
+# ============================= FUNCTIONS =============================
+# Jobs are plain module level functions of n so that they can be sent to the process pool
+def sum_to_n(n):
+    result = 0
+    i = 1
+    while i <= n:
+        # result += i (Had removed this as it was giving out of bound error)
+        result = result + 1
+        i += 1
+    return result
 
-    my_port = args.port
-    my_id = args.id
-    my_interval = args.interval
+def sleep_for_seconds(n):
+    time.sleep(n)
+    return 0
 
-    logging.basicConfig(
-        filename=f"./server/logs/worker_{my_id}.log",
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s"
-    )
+JOBS = {
+    ComputeType.SUM_TO_N.value: sum_to_n,
+    ComputeType.SLEEP_FOR_SECONDS.value: sleep_for_seconds
+}
+CPU_BOUND_JOBS = {ComputeType.SUM_TO_N.value}
+# Jobs whose result only depends on n, the only ones that may be cached (--cache)
+DETERMINISTIC_JOBS = {ComputeType.SUM_TO_N.value}
+
+async def async_sleep_for_seconds(n):
+    await asyncio.sleep(n)
+    return 0
+
+# Versions of the jobs that run on the event loop itself
+ASYNC_JOBS = {
+    ComputeType.SLEEP_FOR_SECONDS.value: async_sleep_for_seconds
+}
+
+def runs_in_process_pool(job_type):
+    if executor_backend == "processes":
+        return True
+    if executor_backend == "hybrid":
+        return job_type in CPU_BOUND_JOBS
+    return False
 
-    data = {
-        "service": {
-            "name": "worker",
-            "id": f"w-{my_id}",
-            "port": my_port,
-            "check": {
-                "http": f"http://localhost:{my_port}/health",
-                "interval": f"{my_interval}s"
-            }
-        }
-    }
-
-    # Creating a consul service definition file
-    with open(f"./server/worker_{my_id}.json", "w") as json_file:
-        json.dump(data, json_file)
-    logging.info("Worker service definition file created")
-
-    # Registering the service with consul
-    command = ["consul", "services", "register", f"./server/worker_{my_id}.json"]
+def execute_job(job, request):
+    if runs_in_process_pool(request.type):
+        # The gRPC thread only waits for the result, the work runs on another core
+        pool = process_pool
+        try:
+            return pool.submit(job, request.n).result()
+        except BrokenProcessPool:
+            replace_broken_process_pool(pool)
+            raise
+    return job(request.n)
+
+async def execute_job_async(job, request):
+    if request.type in ASYNC_JOBS:
+        return await ASYNC_JOBS[request.type](request.n)
+    if not runs_in_process_pool(request.type):
+        return await asyncio.get_running_loop().run_in_executor(executor, job, request.n)
+    pool = process_pool
     try:
-        result = subprocess.run(command, check=True)
-        logging.info("Worker service registered with consul")
-    except subprocess.CalledProcessError as e:
-        logging.error("Error registering worker service")
-        sys.exit(1)
+        return await asyncio.get_running_loop().run_in_executor(pool, job, request.n)
+    except BrokenProcessPool:
+        replace_broken_process_pool(pool)
+        raise
 
-    # Starting the worker server
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    worker_grpc.add_WorkerServicer_to_server(WorkerServicer(), server)
-    server.add_insecure_port(f"localhost:{my_port}")
-    server.start()
-    logging.info(f"Worker {my_id} server started")
+# A job process died and took the pool with it (every later submit would fail). The
+# requests that were running on it fail, the next ones get a new pool. Requests that
+# see the same broken pool only replace it once.
+def replace_broken_process_pool(broken_pool):
+    global process_pool
+    with process_pool_lock:
+        if process_pool is not broken_pool:
+            return
+        process_pool = futures.ProcessPoolExecutor(max_workers=process_pool_size)
+    broken_pool.shutdown(wait=False, cancel_futures=True)
+    logging.warning(f"Process pool replaced with a new one of {process_pool_size} processes")
+
+def run_job(request):
+    job = JOBS.get(request.type)
+    if job is None:
+        return error_response("Invalid request type")
 
-    # Registering myself with the load balancing server
+    try:
+        if request.type in cached_jobs:
+            result = result_cache.get_or_compute((request.type, request.n), lambda: execute_job(job, request))
+        else:
+            result = execute_job(job, request)
+    except BrokenProcessPool:
+        logging.error("Process pool is broken, a job process died")
+        return error_response("Worker process pool failed")
+    return success_response(result)
+
+async def run_job_async(request):
+    job = JOBS.get(request.type)
+    if job is None:
+        return error_response("Invalid request type")
+
+    try:
+        if request.type in cached_jobs:
+            result = await result_cache.get_or_compute_async((request.type, request.n), lambda: execute_job_async(job, request))
+        else:
+            result = await execute_job_async(job, request)
+    except BrokenProcessPool:
+        logging.error("Process pool is broken, a job process died")
+        return error_response("Worker process pool failed")
+    return success_response(result)
+
+def success_response(result):
+    response_obj = worker_pb2.ComputeResponse()
+    response_obj.err_code = 0
+    response_obj.msg = "Success"
+    response_obj.result = result
+    return response_obj
+
+def error_response(msg):
+    response_obj = worker_pb2.ComputeResponse()
+    response_obj.err_code = 1
+    response_obj.msg = msg
+    response_obj.result = -1
+    return response_obj
+
+# Registering myself with the load balancing server
+def register_with_lb():
     lb_port = get_lb_port()
     lb_channel = grpc.insecure_channel(f"localhost:{lb_port}")
     lb_stub = lb_grpc.LBStub(lb_channel)
@@ -134,6 +313,7 @@ if __name__ == "__main__":
     request_obj.id = my_id
     request_obj.ip = "localhost"
     request_obj.port = my_port
+    request_obj.capacity = my_capacity
 
     response = lb_stub.RegisterWorker(request_obj)
     if response.err_code == 0:
@@ -142,10 +322,209 @@ if __name__ == "__main__":
         logging.error(response.msg)
     lb_channel.close()
 
+
+# ============================= THREADS =============================
+# Generates load reports for the stream until `stop` is set. `wakeup` is set when
+# the stream ends or the LB asks for a new interval, so we don't sleep out the old one.
+def load_reports(stop, wakeup):
+    while not stop.is_set():
+        yield load_sampler.sample()
+        wakeup.wait(report_interval)
+        wakeup.clear()
+
+# Keeps one long-lived StreamLoad call open to the Load Listener and reconnects
+# with exponential backoff whenever it breaks
+def report_load():
+    global report_interval, report_wakeup
+    backoff = MIN_BACKOFF_SEC
+    while True:
+        stop = threading.Event()
+        wakeup = threading.Event()
+        report_wakeup = wakeup
+        ll_channel = None
+        try:
+            ll_port = get_ll_port()
+            ll_channel = grpc.insecure_channel(f"localhost:{ll_port}")
+            ll_stub = lb_grpc.LoadListenerStub(ll_channel)
+            for response in ll_stub.StreamLoad(load_reports(stop, wakeup)):
+                if response.err_code != 0:
+                    logging.error(response.msg)
+                    continue
+                if response.interval > 0 and response.interval != report_interval:
+                    report_interval = response.interval
+                    wakeup.set()
+                backoff = MIN_BACKOFF_SEC
+                logging.info(f"Load stream to Load Balancer open, reporting every {report_interval}s")
+            logging.warning("Load stream closed by Load Balancer")
+        except grpc.RpcError as e:
+            logging.error(f"Load stream failed: {e.code()}")
+        except Exception as e:
+            logging.error(f"Could not open load stream: {e}")
+        finally:
+            stop.set()
+            wakeup.set()
+            if ll_channel is not None:
+                ll_channel.close()
+        time.sleep(backoff)
+        backoff = min(backoff * 2, MAX_BACKOFF_SEC)
+
+# Called by the admission queue, the LB stops assigning requests to us while we are saturated
+def on_saturation_change(saturated):
+    if saturated:
+        logging.warning("Admission queue full, asking the Load Balancer to skip this worker")
+    else:
+        logging.info("Admission queue drained")
+    if report_wakeup is not None:
+        report_wakeup.set()
+
+def shutdown_handler(signum, frame):
+    if result_cache is not None:
+        logging.info(f"Result cache: {result_cache.stats()}")
+    if admission is not None:
+        logging.info(f"Admission: {admission.stats()}")
+    sys.exit(0)
+
+# ============================= SERVERS =============================
+def serve_threads(n_threads, admission_args):
+    global executor, servicer, load_sampler, admission
+
+    # Starting the worker server
+    max_rpcs = None
+    if admission_args is not None:
+        admission = AdmissionController(*admission_args, on_saturation_change=on_saturation_change)
+        # Queued requests wait inside the handler so that their queue time is measured, every one
+        # needs a thread. gRPC rejects anything over the limit itself with RESOURCE_EXHAUSTED.
+        max_rpcs = admission.max_concurrent + admission.max_queue
+        n_threads = max(n_threads, max_rpcs)
+    executor = QueueCountingExecutor(max_workers=n_threads)
+    servicer = WorkerServicer()
+    load_sampler = LoadSampler()
+    server = grpc.server(executor, maximum_concurrent_rpcs=max_rpcs)
+    worker_grpc.add_WorkerServicer_to_server(servicer, server)
+    server.add_insecure_port(f"localhost:{my_port}")
+    server.start()
+    logging.info(f"Worker {my_id} server started")
+
+    register_with_lb()
+
     # Start the load notifier thread
     health_thread = threading.Thread(target=report_load, daemon=True)
     health_thread.start()
     logging.info("Load Reporting thread started")
 
     # Waiting for termination
-    server.wait_for_termination()
\ No newline at end of file
+    server.wait_for_termination()
+
+# Sleep jobs are timers on the event loop, CPU jobs go to `executor` (n_threads threads)
+# or the process pool, so the number of concurrent requests is not tied to a thread count
+async def serve_aio(n_threads, admission_args):
+    global executor, servicer, load_sampler, admission
+
+    max_rpcs = None
+    if admission_args is not None:
+        admission = AsyncAdmissionController(*admission_args, on_saturation_change=on_saturation_change)
+        max_rpcs = admission.max_concurrent + admission.max_queue
+    executor = QueueCountingExecutor(max_workers=n_threads)
+    servicer = AioWorkerServicer()
+    load_sampler = LoadSampler()
+    server = grpc.aio.server(maximum_concurrent_rpcs=max_rpcs)
+    worker_grpc.add_WorkerServicer_to_server(servicer, server)
+    server.add_insecure_port(f"localhost:{my_port}")
+    await server.start()
+    logging.info(f"Worker {my_id} server (asyncio) started")
+
+    await asyncio.to_thread(register_with_lb)
+
+    # The load stream keeps its own thread, it is a single long-lived call
+    health_thread = threading.Thread(target=report_load, daemon=True)
+    health_thread.start()
+    logging.info("Load Reporting thread started")
+
+    # Waiting for termination
+    await server.wait_for_termination()
+
+
+# ============================= MAIN =============================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Worker')
+    parser.add_argument("--port", type=int, help="Port Number for Worker")
+    parser.add_argument("--id", type=int, help="Worker ID")
+    parser.add_argument("--interval", type=int, default=10, help="Interval for Health Check")
+    parser.add_argument("--executor", type=str, default="threads", choices=["threads", "processes", "hybrid"], help="Where jobs run: gRPC threads, a process pool, or the process pool for CPU-bound jobs only")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Size of the process pool (default: number of cores)")
+    parser.add_argument("--threads", type=int, default=None, help="gRPC server threads (default: max(10, --processes) with a process pool, 10 otherwise)")
+    parser.add_argument("--server", type=str, default="threads", choices=["threads", "aio"], help="threads: gRPC thread pool server, aio: grpc.aio server where waiting jobs don't hold a thread")
+    parser.add_argument("--cache", type=str, default="", help="Comma separated job types whose results are cached, e.g. SUM_TO_N (default: none)")
+    parser.add_argument("--cache_size", type=int, default=1024, help="Maximum number of cached results")
+    parser.add_argument("--cache_ttl", type=float, default=None, help="Seconds a cached result stays valid (default: forever)")
+    parser.add_argument("--cache_eviction", type=str, default="lru", choices=["lru", "fifo"], help="Which cached result is dropped first when the cache is full")
+    parser.add_argument("--max_concurrent", type=int, default=None, help="Compute requests running at once, the rest wait in the admission queue (default: no admission control)")
+    parser.add_argument("--max_queue", type=int, default=None, help="Requests that may wait for an admission slot, the next ones are rejected with RESOURCE_EXHAUSTED (default: --max_concurrent)")
+    parser.add_argument("--queue_budget", type=float, default=None, help="Seconds a request may wait for an admission slot before it is rejected (default: no limit)")
+    parser.add_argument("--capacity", type=int, default=os.cpu_count(), help="Weight of this worker in the LB's wrr policy (default: number of cores)")
+    parser.add_argument("--registry", type=str, default=DEFAULT_REGISTRY, help="consul://host:port, or lb://host:port to use the built-in registry of the LB at that address")
+    parser.add_argument("--log_format", type=str, default="text", choices=["text", "json"], help="Worker log format, json writes one JSON object per line")
+    parser.add_argument("--log_sample", type=str, default="", help="Fraction of per-request log messages kept by type, e.g. compute=0.01")
+    parser.add_argument("--log_rate", type=str, default="compute=100", help="Maximum per-request log messages per second by type (types: compute)")
+    args = parser.parse_args()
+
+    my_port = args.port
+    my_id = args.id
+    my_interval = args.interval
+    my_capacity = args.capacity
+    report_interval = my_interval
+    executor_backend = args.executor
+
+    for name in filter(None, args.cache.split(",")):
+        try:
+            job_type = ComputeType[name.strip().upper()].value
+        except KeyError:
+            parser.error(f"Unknown job type {name} in --cache")
+        if job_type not in DETERMINISTIC_JOBS:
+            parser.error(f"Results of {name} can't be cached")
+        cached_jobs.add(job_type)
+    if cached_jobs:
+        result_cache = ResultCache(max_size=args.cache_size, ttl=args.cache_ttl, eviction=args.cache_eviction)
+
+    # Log the cache counters on shutdown
+    signal.signal(signal.SIGINT, shutdown_handler)
+    signal.signal(signal.SIGTERM, shutdown_handler)
+
+    # Log lines are written by a background thread, per-request messages can be sampled / rate limited
+    setup_logging(
+        f"./server/logs/worker_{my_id}.log",
+        level=logging.INFO,
+        log_format=args.log_format,
+        sample_rates=parse_log_limits(args.log_sample),
+        rate_limits=parse_log_limits(args.log_rate)
+    )
+
+    # Registering the service (Consul HTTP API or the LB's built-in registry)
+    set_registry(create_registry(args.registry))
+    try:
+        get_registry().register("worker", worker_service_id(my_id), my_port, my_interval)
+        logging.info("Worker service registered")
+    except (requests.RequestException, grpc.RpcError, RuntimeError) as e:
+        logging.error(f"Error registering worker service: {e}")
+        sys.exit(1)
+
+    # Starting the process pool, every pool process can keep one core busy
+    n_threads = 10
+    if executor_backend != "threads":
+        process_pool_size = args.processes
+        process_pool = futures.ProcessPoolExecutor(max_workers=process_pool_size)
+        n_threads = max(n_threads, args.processes)
+        logging.info(f"Process pool with {args.processes} processes started ({executor_backend} mode)")
+    if args.threads is not None:
+        n_threads = args.threads
+
+    # (max_concurrent, max_queue, queue_budget) of the admission queue
+    admission_args = None
+    if args.max_concurrent is not None:
+        max_queue = args.max_queue if args.max_queue is not None else args.max_concurrent
+        admission_args = (args.max_concurrent, max_queue, args.queue_budget)
+
+    if args.server == "aio":
+        asyncio.run(serve_aio(n_threads, admission_args))
+    else:
+        serve_threads(n_threads, admission_args)
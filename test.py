@@ -1,37 +1,60 @@
 import subprocess
+import socket
 import time
 import signal
 import argparse
 
+# Polls until something accepts connections on the port instead of sleeping a fixed time
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("localhost", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout}s")
+
 def start_testing(args):
     processes = []
+    # local: the LB serves the registry itself, no Consul agent
+    if args.registry == "local":
+        registry = f"lb://localhost:{args.lb_port}"
+    else:
+        registry = "consul://localhost:8500"
 
     try:
-        # Start Consul
-        print("Starting Consul...")
-        processes.append(subprocess.Popen(["consul", "agent", "-dev"], stdout=subprocess.PIPE, stderr=subprocess.PIPE))
-        time.sleep(2)
+        if args.registry == "consul":
+            # Start Consul
+            print("Starting Consul...")
+            processes.append(subprocess.Popen(["consul", "agent", "-dev"], stdout=subprocess.PIPE, stderr=subprocess.PIPE))
+            wait_for_port(8500)
 
         # Start Load Balancer
         print("Starting Load Balancer...")
-        processes.append(subprocess.Popen(["python3", "server/lb.py", f"--port={args.lb_port}", f"--interval={args.interval}", f"--policy={args.policy}"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
-        time.sleep(2)
+        processes.append(subprocess.Popen(["python3", "server/lb.py", f"--port={args.lb_port}", f"--interval={args.interval}", f"--policy={args.policy}", f"--mode={args.lb_mode}", f"--registry={registry}"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+        wait_for_port(args.lb_port)
 
         # Start worker processes
         print(f"Starting {args.n_workers} Worker processes...")
         for i in range(1, args.n_workers + 1):
             print(f"Starting Worker {i}...")
-            processes.append(subprocess.Popen(["python3", "server/worker.py", f"--port={args.lb_port + 1 + i}", f"--id={i}", f"--interval={args.interval}"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
+            processes.append(subprocess.Popen(["python3", "server/worker.py", f"--port={args.lb_port + 1 + i}", f"--id={i}", f"--interval={args.interval}", f"--executor={args.executor}", f"--server={args.worker_server}", f"--registry={registry}"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT))
         # processes.append(subprocess.Popen(["make", "workers", f"WORKERS={args.n_workers}"], stdout=subprocess.PIPE, stderr=subprocess.PIPE))
-        time.sleep(2)
+        for i in range(1, args.n_workers + 1):
+            wait_for_port(args.lb_port + 1 + i)
 
         # Start client processes
         print(f"Starting Client processes...")
         client_processes = []
         for i in range(1, args.n_clients + 1):
             print(f"Starting Client {i}...")
-            proc = subprocess.Popen(["python3", "client/client.py", "--mode=s", f"--load={args.load}", f"--reqs={args.n_requests}", f"--id={i}"], 
-                                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            client_args = ["python3", "client/client.py", "--mode=s", f"--load={args.load}", f"--reqs={args.n_requests}", f"--id={i}", f"--registry={registry}"]
+            if args.lb_mode == "proxy":
+                client_args.append(f"--proxy=localhost:{args.lb_port}")
+            elif args.balance != "lb":
+                client_args.append(f"--balance={args.balance}")
+            proc = subprocess.Popen(client_args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
             client_processes.append(proc)
 
         # Wait for all client processes to finish
@@ -57,7 +80,12 @@ if __name__ == "__main__":
     argparser.add_argument("--n_workers",   default=15,      type=int, help="Number of workers to start")
     argparser.add_argument("--n_clients",   default=100,      type=int, help="Number of client processes to start")
     argparser.add_argument("--interval",    default=1,      type=int, help="Interval for health check and load reporting")
-    argparser.add_argument("--policy",      default="rr",   type=str, help="Policy to use for load balancing")
+    argparser.add_argument("--policy",      default="rr",   type=str, choices=["rr", "wrr", "ll", "pf", "p2c", "ring", "ewma"], help="Policy to use for load balancing")
+    argparser.add_argument("--lb_mode",     default="lookaside", type=str, choices=["lookaside", "proxy"], help="Clients ask the LB for a worker (lookaside) or send requests through it (proxy)")
+    argparser.add_argument("--executor",    default="threads", type=str, choices=["threads", "processes", "hybrid"], help="Where workers run jobs")
+    argparser.add_argument("--worker_server", default="threads", type=str, choices=["threads", "aio"], help="Worker gRPC server type")
+    argparser.add_argument("--balance",     default="lb", type=str, choices=["lb", "rr", "ll", "p2c"], help="Clients ask the LB for every worker (lb) or balance locally from the LB's WatchWorkers stream")
+    argparser.add_argument("--registry",    default="consul", type=str, choices=["consul", "local"], help="Service registry: a Consul dev agent, or the registry built into the LB")
     argparser.add_argument("--load",        default="high",  type=str, help="Amount of load to simulate")
     argparser.add_argument("--n_requests",  default=1,    type=int, help="Number of requests to run for each client")
 
@@ -0,0 +1,85 @@
+import argparse
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.resolve() / "../utils"))
+from indexed_heap import IndexedMinHeap
+
+# Microbenchmark of the Least-Loaded policy: cost of picking a worker and of applying
+# a load report, for the old linear scan vs the indexed min-heap used by lb.py
+
+def make_workers(n_workers):
+    workers = []
+    for i in range(n_workers):
+        workers.append({
+            "id": i + 1,
+            "status": "active" if random.random() < 0.9 else "inactive",
+            "load": random.uniform(0, 100)
+        })
+    return workers
+
+# Old GetServer / ReportLoad code paths
+def linear_select(workers):
+    min_load = 100
+    min_load_worker_idx = -1
+    for idx, worker in enumerate(workers):
+        if worker["status"] == "active" and worker["load"] < min_load:
+            min_load = worker["load"]
+            min_load_worker_idx = idx
+    return min_load_worker_idx
+
+def linear_report(workers, worker_id, load):
+    for worker in workers:
+        if worker["id"] == worker_id:
+            worker["load"] = load
+            break
+
+# New code paths
+def heap_select(heap, workers_by_id):
+    top = heap.peek()
+    if top is not None and top[0] < 100:
+        return workers_by_id[top[1]]
+    return None
+
+def heap_report(heap, workers_by_id, worker_id, load):
+    worker = workers_by_id.get(worker_id)
+    if worker is not None:
+        worker["load"] = load
+        if worker_id in heap:
+            heap.update(worker_id, load)
+
+def bench(n_workers, n_iters):
+    workers = make_workers(n_workers)
+    workers_by_id = {worker["id"]: worker for worker in workers}
+    heap = IndexedMinHeap()
+    for worker in workers:
+        if worker["status"] == "active":
+            heap.push(worker["id"], worker["load"])
+
+    ids = [random.randint(1, n_workers) for _ in range(n_iters)]
+    new_loads = [random.uniform(0, 100) for _ in range(n_iters)]
+    reports = list(zip(ids, new_loads))
+
+    results = {}
+    results["linear select"] = timeit.timeit(lambda: linear_select(workers), number=n_iters) / n_iters
+    results["heap select"] = timeit.timeit(lambda: heap_select(heap, workers_by_id), number=n_iters) / n_iters
+
+    it = iter(reports * 2)
+    results["linear report"] = timeit.timeit(lambda: linear_report(workers, *next(it)), number=n_iters) / n_iters
+    results["heap report"] = timeit.timeit(lambda: heap_report(heap, workers_by_id, *next(it)), number=n_iters) / n_iters
+    return results
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--sizes", type=str, default="10,100,1000,10000", help="Comma separated worker counts")
+    argparser.add_argument("--iters", type=int, default=2000, help="Iterations per measurement")
+    args = argparser.parse_args()
+
+    random.seed(0)
+    columns = ["linear select", "heap select", "linear report", "heap report"]
+    print(f"{'workers':>8} | " + " | ".join(f"{c + ' (us)':>18}" for c in columns))
+    for n_workers in [int(size) for size in args.sizes.split(",")]:
+        results = bench(n_workers, args.iters)
+        print(f"{n_workers:>8} | " + " | ".join(f"{results[c] * 1e6:>18.2f}" for c in columns))
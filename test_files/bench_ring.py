@@ -0,0 +1,86 @@
+import argparse
+import math
+import random
+import sys
+import timeit
+from collections import Counter
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.resolve() / "../utils"))
+from hash_ring import ConsistentHashRing, hash_key
+
+# Benchmark of the ring policy's consistent hash ring: lookup cost, share of keys that
+# move to another worker when one joins or leaves (ideal: 1/n), compared with plain
+# `hash % n`, and the largest worker load relative to the average with bounded loads
+
+def make_ring(n_workers, vnodes):
+    ring = ConsistentHashRing(vnodes=vnodes)
+    for worker_id in range(1, n_workers + 1):
+        ring.add(worker_id)
+    return ring
+
+def lookup_cost(ring, keys, n_iters):
+    it = iter(keys * (n_iters // len(keys) + 1))
+    plain = timeit.timeit(lambda: ring.lookup(next(it)), number=n_iters) / n_iters
+    # Bounded loads with nobody full: the predicate is called once
+    it = iter(keys * (n_iters // len(keys) + 1))
+    bounded = timeit.timeit(lambda: ring.lookup(next(it), lambda worker_id: True), number=n_iters) / n_iters
+    return plain, bounded
+
+def moved_share(before, after, keys):
+    return sum(1 for key in keys if before(key) != after(key)) / len(keys)
+
+def key_movement(n_workers, vnodes, keys):
+    ring = make_ring(n_workers, vnodes)
+    owners = {key: ring.lookup(key) for key in keys}
+    ring.add(n_workers + 1)
+    joined = moved_share(owners.get, ring.lookup, keys)
+    ring.remove(n_workers + 1)
+    ring.remove(1)
+    left = moved_share(owners.get, ring.lookup, keys)
+
+    hashes = {key: hash_key(key) for key in keys}
+    modulo = moved_share(lambda key: hashes[key] % n_workers, lambda key: hashes[key] % (n_workers + 1), keys)
+    return joined, left, modulo
+
+def bounded_spread(n_workers, vnodes, epsilon, n_requests):
+    # Requests keep their worker busy (nothing completes), keys are Zipf distributed so a
+    # few hot keys would pile onto one worker without the bound
+    ring = make_ring(n_workers, vnodes)
+    weights = [1 / rank for rank in range(1, 1001)]
+    keys = random.choices([f"1:{n}" for n in range(1000)], weights=weights, k=n_requests)
+    results = {}
+    for name, eps in (("unbounded", None), ("bounded", epsilon)):
+        loads = Counter()
+        total = 0
+        for key in keys:
+            if eps is None:
+                worker_id = ring.lookup(key)
+            else:
+                bound = math.ceil((1 + eps) * (total + 1) / n_workers)
+                worker_id = ring.lookup(key, lambda worker_id: loads[worker_id] < bound)
+            loads[worker_id] += 1
+            total += 1
+        results[name] = max(loads.values()) / (total / n_workers)
+    return results
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--sizes", type=str, default="10,100,1000", help="Comma separated worker counts")
+    argparser.add_argument("--vnodes", type=int, default=100, help="Virtual nodes per worker")
+    argparser.add_argument("--epsilon", type=float, default=0.25, help="Bounded loads: largest load is at most (1 + epsilon) * average")
+    argparser.add_argument("--keys", type=int, default=20000, help="Keys used to measure key movement")
+    argparser.add_argument("--iters", type=int, default=20000, help="Iterations per lookup measurement")
+    args = argparser.parse_args()
+
+    random.seed(0)
+    keys = [f"1:{n}" for n in range(args.keys)]
+    columns = ["lookup (us)", "bounded (us)", "moved join", "moved leave", "ideal 1/n", "moved hash%n", "max/avg", "max/avg bnd"]
+    print(f"{'workers':>8} | " + " | ".join(f"{c:>12}" for c in columns))
+    for n_workers in [int(size) for size in args.sizes.split(",")]:
+        ring = make_ring(n_workers, args.vnodes)
+        plain, bounded = lookup_cost(ring, keys, args.iters)
+        joined, left, modulo = key_movement(n_workers, args.vnodes, keys)
+        spread = bounded_spread(n_workers, args.vnodes, args.epsilon, n_workers * 50)
+        row = [plain * 1e6, bounded * 1e6, joined, left, 1 / n_workers, modulo, spread["unbounded"], spread["bounded"]]
+        print(f"{n_workers:>8} | " + " | ".join(f"{value:>12.3f}" for value in row))
@@ -1,23 +1,36 @@
-import json
+import sys
 import matplotlib.pyplot as plt
+import numpy as np
 import argparse
+from pathlib import Path
 
-def visualise_load(policy, n_workers, load):
-    # Load the JSON data
-    with open("./test_files/load.json", "r") as f:
-        data = json.load(f)
+sys.path.append(str(Path(__file__).parent.resolve() / "../utils"))
+from metrics_log import MetricsLogReader
+
+MAX_POINTS_PER_WORKER = 5000    # Longer series are downsampled before plotting
+
+def visualise_load(policy, n_workers, load, log_dir):
+    # Memory-map the binary load log written by the Load Balancer
+    records = MetricsLogReader(log_dir).to_numpy()
+    if len(records) == 0:
+        print(f"No load records in {log_dir}")
+        return
+    start = records["timestamp"].min()
 
     plt.figure(figsize=(10, 6))  # Adjust the figure size
 
     # Iterate over each worker ID and plot its load over time
-    for worker_id, loads in data.items():
-        x = list(range(1, len(loads) + 1))  # X-axis: Time (assuming sequential timestamps)
-        y = loads  # Y-axis: Load percentages
-        
-        plt.plot(x, y, marker="o", linestyle="-", label=f"Worker {worker_id}")  # Line with markers
+    for worker_id in np.unique(records["worker_id"]):
+        worker_records = records[records["worker_id"] == worker_id]
+        step = max(1, len(worker_records) // MAX_POINTS_PER_WORKER)
+        x = worker_records["timestamp"][::step] - start   # X-axis: Seconds since the first report
+        y = worker_records["load"][::step]                 # Y-axis: Load percentages
+
+        marker = "o" if step == 1 and len(x) <= 500 else None   # Markers only help on short runs
+        plt.plot(x, y, marker=marker, linestyle="-", label=f"Worker {worker_id}")  # Line with markers
 
     # Labels and title
-    plt.xlabel("Time")
+    plt.xlabel("Time (s)")
     plt.ylabel("Load (%)")
     plt.title("Worker Load Over Time")
 
@@ -34,6 +47,7 @@ if __name__ == "__main__":
     argparser.add_argument("--policy", type=str, help="Specify the policy for which the graph is being plotted")
     argparser.add_argument("--workers", type=int, help="Number of workers used for testing")
     argparser.add_argument("--load", type=str, help="Load amount for testing")
+    argparser.add_argument("--log_dir", type=str, default="./test_files/load_log", help="Directory of the Load Balancer's binary load log")
 
     args = argparser.parse_args()
     policy = args.policy
@@ -41,4 +55,4 @@ if __name__ == "__main__":
     load = args.load
 
     # Call the function to generate the plot
-    visualise_load(policy, n_workers, load)
+    visualise_load(policy, n_workers, load, args.log_dir)
@@ -0,0 +1,149 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+# ============================= CLASSES =============================
+class AdmissionRejected(Exception):
+    # Raised when a request is not admitted, the message says why
+    pass
+
+
+class _AdmissionState:
+    # Bounded admission queue in front of the jobs:
+    #   max_concurrent - Requests running at once
+    #   max_queue      - Requests allowed to wait for a slot, the next ones are rejected right away
+    #   queue_budget   - Seconds a request may wait for a slot before it is rejected (None: no limit)
+    #   on_saturation_change - Called with True once the next request would be rejected and with
+    #                          False once the queue has drained. Runs with the lock held, keep it short.
+    def __init__(self, max_concurrent, max_queue=0, queue_budget=None, on_saturation_change=None):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_budget = queue_budget
+        self.on_saturation_change = on_saturation_change
+
+        self.running = 0
+        self.waiting = 0
+        self.saturated = False
+
+        self.admitted = 0
+        self.rejected_full = 0      # Queue was full on arrival
+        self.rejected_timeout = 0   # Waited longer than queue_budget
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "saturated": self.saturated,
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout
+        }
+
+    def _has_slot(self):
+        return self.running < self.max_concurrent
+
+    def _queue_full(self):
+        return self.waiting >= self.max_queue
+
+    # Must be called with the lock held. Saturated as soon as a new request would be
+    # rejected, drained once nothing waits and at most half of the slots are busy so
+    # that the signal doesn't flip on every request around the limit.
+    def _update_saturation(self):
+        if not self.saturated and not self._has_slot() and self._queue_full():
+            saturated = True
+        elif self.saturated and self.waiting == 0 and self.running <= self.max_concurrent // 2:
+            saturated = False
+        else:
+            return
+        self.saturated = saturated
+        if self.on_saturation_change is not None:
+            self.on_saturation_change(saturated)
+
+
+# For thread pool servers: `with admission.slot(): ...`
+class AdmissionController(_AdmissionState):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _acquire(self):
+        with self._cond:
+            if not self._has_slot():
+                if self._queue_full():
+                    self.rejected_full += 1
+                    raise AdmissionRejected("Worker saturated, admission queue full")
+                self.waiting += 1
+                self._update_saturation()
+                try:
+                    admitted = self._cond.wait_for(self._has_slot, self.queue_budget)
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    self.rejected_timeout += 1
+                    self._update_saturation()
+                    raise AdmissionRejected(f"Waited more than {self.queue_budget}s for an admission slot")
+            self.running += 1
+            self.admitted += 1
+            self._update_saturation()
+
+    def _release(self):
+        with self._cond:
+            self.running -= 1
+            self._update_saturation()
+            self._cond.notify()
+
+
+# For grpc.aio servers: `async with admission.slot(): ...`
+class AsyncAdmissionController(_AdmissionState):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self._acquire()
+        try:
+            yield
+        finally:
+            await self._release()
+
+    async def _acquire(self):
+        async with self._cond:
+            if not self._has_slot():
+                if self._queue_full():
+                    self.rejected_full += 1
+                    raise AdmissionRejected("Worker saturated, admission queue full")
+                self.waiting += 1
+                self._update_saturation()
+                admitted = False
+                try:
+                    await asyncio.wait_for(self._cond.wait_for(self._has_slot), self.queue_budget)
+                    admitted = True
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    self.waiting -= 1
+                    if not admitted:
+                        # A wakeup meant for us may have been consumed while we were giving up
+                        self._cond.notify()
+                if not admitted:
+                    self.rejected_timeout += 1
+                    self._update_saturation()
+                    raise AdmissionRejected(f"Waited more than {self.queue_budget}s for an admission slot")
+            self.running += 1
+            self.admitted += 1
+            self._update_saturation()
+
+    async def _release(self):
+        async with self._cond:
+            self.running -= 1
+            self._update_saturation()
+            self._cond.notify()
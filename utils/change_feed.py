@@ -0,0 +1,41 @@
+import asyncio
+import threading
+
+# ============================= CLASSES =============================
+class ChangeFeed:
+    # Version counter that streaming RPCs wait on. Writers call bump() on every change,
+    # subscribers wait until the version differs from the last one they sent, either
+    # blocking a thread (wait) or awaiting on an event loop (wait_async). bump() may be
+    # called from any thread.
+    def __init__(self):
+        self.version = 0
+        self._cond = threading.Condition()
+        self._async_waiters = set()     # {(loop, asyncio.Event), ...}
+
+    def bump(self):
+        with self._cond:
+            self.version += 1
+            self._cond.notify_all()
+            waiters = list(self._async_waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def wait(self, last_version, timeout=None):
+        # Returns the current version, which equals last_version on timeout
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != last_version, timeout)
+            return self.version
+
+    async def wait_async(self, last_version, timeout=None):
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            self._async_waiters.add(waiter)
+        try:
+            if self.version == last_version:
+                await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+        return self.version
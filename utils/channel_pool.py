@@ -0,0 +1,126 @@
+import asyncio
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import grpc
+
+# ============================= CLASSES =============================
+class ChannelPool:
+    # Keeps one long-lived gRPC channel per address so that repeated calls to the
+    # same LB / worker reuse the existing HTTP/2 connection instead of paying for a
+    # new TCP + HTTP/2 handshake every time.
+    #   max_size     - Maximum number of channels kept open (least recently used is closed first)
+    #   idle_timeout - Channels not used for this many seconds are closed on the next access.
+    #                  Channels with calls started through use() are never closed while they run.
+    #   channel_factory - grpc.insecure_channel, or grpc.aio.insecure_channel for asyncio code
+    def __init__(self, max_size=64, idle_timeout=60.0, channel_factory=grpc.insecure_channel):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.channel_factory = channel_factory
+        self._entries = OrderedDict()   # address -> {"channel", "stubs", "last_used", "active"}
+        self._lock = threading.Lock()
+
+    def get_channel(self, address):
+        with self._lock:
+            return self._get_entry(address)["channel"]
+
+    def get_stub(self, address, stub_cls):
+        # Stubs are cached per channel as well, creating them rebuilds all the multi-callables
+        with self._lock:
+            return self._get_stub(self._get_entry(address), stub_cls)
+
+    @contextmanager
+    def use(self, address, stub_cls):
+        # get_stub for calls that may outlive idle_timeout (long calls, streams): the
+        # channel is marked in use until the block exits, eviction skips it meanwhile
+        with self._lock:
+            entry = self._get_entry(address, claim=True)
+            stub = self._get_stub(entry, stub_cls)
+        try:
+            yield stub
+        finally:
+            with self._lock:
+                entry["active"] -= 1
+                entry["last_used"] = time.monotonic()
+                # Back to the most recently used end, _evict_idle relies on the order
+                if self._entries.get(address) is entry:
+                    self._entries.move_to_end(address)
+
+    def close(self, address):
+        # Used when a call to the address fails so that the next call reconnects
+        with self._lock:
+            entry = self._entries.pop(address, None)
+        if entry is not None:
+            _close_channel(entry["channel"])
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            _close_channel(entry["channel"])
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    # Must be called with self._lock held. With claim=True the entry is marked in use
+    # (for use()) before anything is evicted, so it can't be closed on the way out.
+    def _get_entry(self, address, claim=False):
+        now = time.monotonic()
+        entry = self._entries.get(address)
+        if entry is not None:
+            entry["last_used"] = now
+            self._entries.move_to_end(address)
+            if claim:
+                entry["active"] += 1
+        self._evict_idle(now)
+
+        if entry is None:
+            entry = {
+                "channel": self.channel_factory(address),
+                "stubs": {},
+                "last_used": now,
+                "active": 1 if claim else 0     # Calls running through use()
+            }
+            self._entries[address] = entry
+            # Over the size limit, close the least recently used channels that are not in
+            # use, never the one we are about to hand out
+            excess = len(self._entries) - self.max_size
+            if excess > 0:
+                evicted = [a for a, e in self._entries.items() if e["active"] == 0 and a != address][:excess]
+                for evicted_address in evicted:
+                    _close_channel(self._entries.pop(evicted_address)["channel"])
+        return entry
+
+    # Must be called with self._lock held
+    def _get_stub(self, entry, stub_cls):
+        stub = entry["stubs"].get(stub_cls)
+        if stub is None:
+            stub = stub_cls(entry["channel"])
+            entry["stubs"][stub_cls] = stub
+        return stub
+
+    # Must be called with self._lock held
+    def _evict_idle(self, now):
+        # Entries are kept in least recently used order so we only have to look at the
+        # front, past the channels that are idle but still in use
+        idle = []
+        for address, entry in self._entries.items():
+            if now - entry["last_used"] < self.idle_timeout:
+                break
+            if entry["active"] == 0:
+                idle.append(address)
+        for address in idle:
+            _close_channel(self._entries.pop(address)["channel"])
+
+
+# ============================= FUNCTIONS =============================
+# grpc.aio channels close with a coroutine, which is scheduled on the running loop
+def _close_channel(channel):
+    result = channel.close()
+    if inspect.isawaitable(result):
+        asyncio.ensure_future(result)
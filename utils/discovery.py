@@ -0,0 +1,183 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+import requests
+
+# ============================= GLOBALS =============================
+DEFAULT_TTL_SEC = 60        # Cached data older than this triggers a background refresh
+BLOCKING_WAIT_SEC = 30      # Maximum time Consul holds a blocking query open
+MIN_BACKOFF_SEC = 0.5
+MAX_BACKOFF_SEC = 10
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+# ============================= CLASSES =============================
+class ServiceCache:
+    # Cached result of a Consul HTTP endpoint (catalog / health). The first lookup
+    # fetches synchronously, after that a watcher thread keeps the data fresh using
+    # Consul blocking queries (?index=), so every later lookup is a memory read.
+    # If the watcher has not confirmed the data within `ttl` seconds (e.g. Consul is
+    # unreachable) a one-shot refresh is started in the background and the stale
+    # value is returned in the meantime.
+    # `on_change` is called with the new value (outside any lock) whenever it changes.
+    def __init__(self, url, ttl=DEFAULT_TTL_SEC, wait=BLOCKING_WAIT_SEC, on_change=None):
+        self.url = url
+        self.ttl = ttl
+        self.wait = wait
+        self.on_change = on_change
+
+        self._value = None
+        self._index = 0
+        self._updated_at = 0.0
+        self._loaded = False
+        self._refreshing = False
+        self._watcher = None
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()     # Only one caller does the initial fetch
+        self._session = requests.Session()      # Used by the watcher thread only
+
+    def get(self):
+        if not self._loaded:
+            with self._fetch_lock:
+                if not self._loaded:
+                    # Errors are raised to the caller, same as a direct request
+                    self._fetch(requests, blocking=False)
+            self.start()
+        elif time.monotonic() - self._updated_at > self.ttl:
+            self._refresh_async()
+        return self._value
+
+    def start(self):
+        with self._lock:
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch, daemon=True)
+                self._watcher.start()
+        return self
+
+    def _refresh_async(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self._fetch(requests, blocking=False)
+            except (requests.RequestException, ValueError) as e:
+                logging.warning(f"Refreshing {self.url} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _watch(self):
+        backoff = MIN_BACKOFF_SEC
+        while True:
+            try:
+                self._fetch(self._session, blocking=True)
+                backoff = MIN_BACKOFF_SEC
+            except (requests.RequestException, ValueError) as e:
+                logging.warning(f"Watching {self.url} failed: {e}, retrying in {backoff}s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF_SEC)
+
+    def _fetch(self, session, blocking):
+        params = {}
+        if blocking:
+            params = {"index": self._index, "wait": f"{self.wait}s"}
+        response = session.get(self.url, params=params, timeout=self.wait + 5)
+        response.raise_for_status()
+        value = response.json()
+        index = int(response.headers.get("X-Consul-Index", 0))
+
+        with self._lock:
+            # Consul docs: reset the index if it goes backwards
+            if index < self._index:
+                index = 0
+            changed = not self._loaded or value != self._value
+            self._value = value
+            self._index = index
+            self._updated_at = time.monotonic()
+            self._loaded = True
+
+        if changed and self.on_change is not None:
+            self.on_change(value)
+
+        # Without a valid index the blocking query returns immediately, so don't spin on it
+        if blocking and index == 0:
+            time.sleep(MIN_BACKOFF_SEC)
+
+
+# Same watch as ServiceCache, but as an asyncio task for the grpc.aio servers:
+#   asyncio.create_task(AsyncServiceWatch(url, on_change).run())
+class AsyncServiceWatch:
+    def __init__(self, url, on_change, wait=BLOCKING_WAIT_SEC):
+        self.url = url
+        self.on_change = on_change
+        self.wait = wait
+        self.value = None
+
+    async def run(self):
+        index = 0
+        loaded = False
+        backoff = MIN_BACKOFF_SEC
+        while True:
+            try:
+                params = {"index": index, "wait": f"{self.wait}s"} if loaded else {}
+                value, headers = await async_get_json(self.url, params, timeout=self.wait + 5)
+                new_index = int(headers.get("x-consul-index", 0))
+                # Consul docs: reset the index if it goes backwards
+                index = new_index if new_index >= index else 0
+                if not loaded or value != self.value:
+                    self.value = value
+                    self.on_change(value)
+                loaded = True
+                backoff = MIN_BACKOFF_SEC
+                # Without a valid index the blocking query returns immediately, so don't spin on it
+                if index == 0:
+                    await asyncio.sleep(MIN_BACKOFF_SEC)
+            except (OSError, asyncio.TimeoutError, ValueError) as e:
+                logging.warning(f"Watching {self.url} failed: {e}, retrying in {backoff}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF_SEC)
+
+
+# ============================= FUNCTIONS =============================
+# Minimal non-blocking HTTP GET for the Consul API (plain HTTP/1.0, so the body is
+# never chunked and ends when the agent closes the connection)
+async def async_get_json(url, params, timeout):
+    parts = urlsplit(url)
+    path = parts.path + ("?" + urlencode(params) if params else "")
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(parts.hostname, parts.port or 80), timeout)
+    try:
+        writer.write(f"GET {path} HTTP/1.0\r\nHost: {parts.netloc}\r\nAccept: application/json\r\n\r\n".encode())
+        await writer.drain()
+        raw = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+
+    head, _, body = raw.partition(b"\r\n\r\n")
+    lines = head.decode("iso-8859-1").split("\r\n")
+    status = int(lines[0].split()[1])
+    if status != 200:
+        raise ValueError(f"HTTP {status} from {url}")
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return json.loads(body), headers
+
+def get_service_cache(url, **kwargs):
+    # One shared cache per endpoint for the whole process
+    with _caches_lock:
+        cache = _caches.get(url)
+        if cache is None:
+            cache = ServiceCache(url, **kwargs)
+            _caches[url] = cache
+        return cache
@@ -0,0 +1,83 @@
+import bisect
+import hashlib
+import random
+import threading
+
+# ============================= CLASSES =============================
+class ConsistentHashRing:
+    # Consistent hash ring with `vnodes` virtual nodes per member. A key belongs to
+    # the first member clockwise from its hash, so adding or removing one of n
+    # members only moves about 1/n of the keys. Lookups are O(log(n * vnodes)) and
+    # don't take a lock: add / remove publish a new (points, owners) pair in one
+    # assignment (copy-on-write, O(n * vnodes) but done in C, membership changes are rare).
+    def __init__(self, vnodes=100):
+        self.vnodes = vnodes
+        self._ring = ([], {})   # (sorted vnode hashes, vnode hash -> member), never modified once published
+        self._members = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._members)
+
+    def __contains__(self, member):
+        return member in self._members
+
+    def add(self, member):
+        with self._lock:
+            if member in self._members:
+                return
+            self._members.add(member)
+            points, owners = self._ring
+            new_points = self._points_of(member)
+            owners = dict(owners)
+            owners.update((point, member) for point in new_points)
+            # Both parts are sorted runs, sorted() merges them in linear time
+            self._ring = (sorted(points + new_points), owners)
+
+    def remove(self, member):
+        with self._lock:
+            if member not in self._members:
+                return
+            self._members.discard(member)
+            points, owners = self._ring
+            points = list(points)
+            owners = dict(owners)
+            for point in self._points_of(member):
+                if owners.get(point) == member:
+                    del points[bisect.bisect_left(points, point)]
+                    del owners[point]
+            self._ring = (points, owners)
+
+    def lookup(self, key, is_eligible=None):
+        # Owner of `key`. With `is_eligible` the ring is walked clockwise past members
+        # for which it returns False (e.g. full ones, see bounded loads in lb.py) and
+        # None is returned if no member qualifies. key=None picks a random point.
+        points, owners = self._ring
+        if not points:
+            return None
+        point = random.getrandbits(64) if key is None else hash_key(key)
+        idx = bisect.bisect_right(points, point) % len(points)
+        if is_eligible is None:
+            return owners[points[idx]]
+
+        seen = set()
+        n_members = len(owners) // self.vnodes
+        for step in range(len(points)):
+            owner = owners[points[(idx + step) % len(points)]]
+            if owner in seen:
+                continue
+            if is_eligible(owner):
+                return owner
+            seen.add(owner)
+            if len(seen) >= n_members:
+                break
+        return None
+
+    def _points_of(self, member):
+        return sorted(hash_key(f"{member}#{i}") for i in range(self.vnodes))
+
+
+# ============================= FUNCTIONS =============================
+# 64 bit position on the ring, stable across processes unlike hash()
+def hash_key(key):
+    return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "big")
@@ -0,0 +1,86 @@
+from array import array
+
+# ============================= CLASSES =============================
+class LatencyHistogram:
+    # HDR-style log-linear histogram of latencies in microseconds. Values below
+    # 2^sub_bucket_bits are counted exactly, above that every power of two is split
+    # into 2^(sub_bucket_bits - 1) linear buckets, so any recorded value is off by
+    # at most 2^-(sub_bucket_bits - 1) (0.8% with the default) at a fixed memory cost.
+    #   highest_sec - Largest latency that can be recorded, larger ones are clamped
+    def __init__(self, highest_sec=3600.0, sub_bucket_bits=8):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.sub_bucket_half = self.sub_bucket_count // 2
+        self.highest = int(highest_sec * 1e6)
+        self.counts = array("Q", bytes(8 * (self._index(self.highest) + 1)))
+
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        value = min(max(int(seconds * 1e6), 0), self.highest)
+        self.counts[self._index(value)] += 1
+        self.total += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        if other.sub_bucket_bits != self.sub_bucket_bits or len(other.counts) != len(self.counts):
+            raise ValueError("Histograms have different layouts")
+        for idx, count in enumerate(other.counts):
+            if count:
+                self.counts[idx] += count
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def percentile(self, p):
+        # Latency in seconds at or below which p percent of the recorded values fall
+        if self.total == 0:
+            return None
+        rank = max(1, -(-self.total * p // 100))    # ceil without floats
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                # The highest value of the bucket, never above the real maximum
+                return min(self._highest_in_bucket(idx), self.max) / 1e6
+        return self.max / 1e6
+
+    def mean(self):
+        return self.sum / self.total / 1e6 if self.total else None
+
+    def buckets(self):
+        # [(upper bound in seconds, count), ...] of the non-empty buckets
+        return [(self._highest_in_bucket(idx) / 1e6, count) for idx, count in enumerate(self.counts) if count]
+
+    def to_dict(self, percentiles=(50, 90, 99, 99.9)):
+        return {
+            "count": self.total,
+            "min": self.min / 1e6 if self.min is not None else None,
+            "mean": self.mean(),
+            "max": self.max / 1e6 if self.max is not None else None,
+            "percentiles": {f"p{p:g}": self.percentile(p) for p in percentiles},
+            "buckets": self.buckets()
+        }
+
+    def _index(self, value):
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return shift * self.sub_bucket_half + (value >> shift)
+
+    def _highest_in_bucket(self, idx):
+        if idx < self.sub_bucket_count:
+            return idx
+        shift = idx // self.sub_bucket_half - 1
+        mantissa = idx - shift * self.sub_bucket_half
+        return ((mantissa + 1) << shift) - 1
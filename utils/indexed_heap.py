@@ -0,0 +1,93 @@
+# ============================= CLASSES =============================
+class IndexedMinHeap:
+    # Binary min-heap of (priority, key) with a key -> position index, so the
+    # priority of any key can be changed or the key removed in O(log n) and the
+    # minimum read in O(1). Ties on priority are broken by the key.
+    def __init__(self):
+        self._heap = []         # [(priority, key), ...]
+        self._position = {}     # key -> index in self._heap
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, key):
+        return key in self._position
+
+    def peek(self):
+        # Returns (priority, key) of the minimum or None if empty. Safe to call
+        # without the writer's lock, in which case the result may be momentarily stale
+        try:
+            return self._heap[0]
+        except IndexError:
+            return None
+
+    def priority(self, key):
+        return self._heap[self._position[key]][0]
+
+    def push(self, key, priority):
+        # Inserts the key or updates its priority if it is already present
+        if key in self._position:
+            self.update(key, priority)
+            return
+        self._heap.append((priority, key))
+        self._position[key] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+
+    def update(self, key, priority):
+        idx = self._position[key]
+        old_priority = self._heap[idx][0]
+        self._heap[idx] = (priority, key)
+        if priority < old_priority:
+            self._sift_up(idx)
+        else:
+            self._sift_down(idx)
+
+    def remove(self, key):
+        idx = self._position.pop(key, None)
+        if idx is None:
+            return
+        last = self._heap.pop()
+        if idx < len(self._heap):
+            # Move the last entry into the hole and restore the heap property
+            self._heap[idx] = last
+            self._position[last[1]] = idx
+            self._sift_up(idx)
+            self._sift_down(self._position[last[1]])
+
+    def pop(self):
+        top = self.peek()
+        if top is not None:
+            self.remove(top[1])
+        return top
+
+    def _swap(self, i, j):
+        heap = self._heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self._position[heap[i][1]] = i
+        self._position[heap[j][1]] = j
+
+    def _sift_up(self, idx):
+        heap = self._heap
+        while idx > 0:
+            parent = (idx - 1) // 2
+            if heap[idx] < heap[parent]:
+                self._swap(idx, parent)
+                idx = parent
+            else:
+                break
+
+    def _sift_down(self, idx):
+        heap = self._heap
+        n = len(heap)
+        while True:
+            smallest = idx
+            left = 2 * idx + 1
+            right = left + 1
+            if left < n and heap[left] < heap[smallest]:
+                smallest = left
+            if right < n and heap[right] < heap[smallest]:
+                smallest = right
+            if smallest == idx:
+                break
+            self._swap(idx, smallest)
+            idx = smallest
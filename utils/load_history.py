@@ -0,0 +1,139 @@
+import threading
+import time
+from array import array
+
+# ============================= CLASSES =============================
+class LoadHistory:
+    # Fixed-size load history of one worker. The last `capacity` samples are kept as
+    # (timestamp, value) in two preallocated ring buffers. Samples pushed out of the
+    # ring are folded into min/avg/max buckets of `bucket_sec` seconds, of which the
+    # last `bucket_capacity` are kept, so memory use never grows after start-up.
+    def __init__(self, capacity=3600, bucket_sec=60.0, bucket_capacity=1440):
+        self.capacity = capacity
+        self.bucket_sec = bucket_sec
+        self.bucket_capacity = bucket_capacity
+
+        self._ts = array("d", bytes(8 * capacity))
+        self._values = array("d", bytes(8 * capacity))
+        self._start = 0     # Index of the oldest raw sample
+        self._count = 0
+
+        self._b_start = array("d", bytes(8 * bucket_capacity))  # Bucket start time
+        self._b_min = array("d", bytes(8 * bucket_capacity))
+        self._b_max = array("d", bytes(8 * bucket_capacity))
+        self._b_sum = array("d", bytes(8 * bucket_capacity))
+        self._b_count = array("L", bytes(array("L").itemsize * bucket_capacity))
+        self._b_first = 0   # Index of the oldest bucket
+        self._b_used = 0
+
+        self._lock = threading.Lock()
+
+    def append(self, value, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            if self._count == self.capacity:
+                # Ring is full, the oldest sample goes to the downsampled buckets
+                self._fold(self._ts[self._start], self._values[self._start])
+                self._ts[self._start] = timestamp
+                self._values[self._start] = value
+                self._start = (self._start + 1) % self.capacity
+            else:
+                idx = (self._start + self._count) % self.capacity
+                self._ts[idx] = timestamp
+                self._values[idx] = value
+                self._count += 1
+
+    def __len__(self):
+        return self._count
+
+    def recent(self, seconds=None, now=None):
+        # [(timestamp, value), ...] of the raw samples of the last `seconds` (all if None), oldest first
+        with self._lock:
+            first = self._first_index_since(self._since(seconds, now))
+            return [(self._ts[self._physical(i)], self._values[self._physical(i)]) for i in range(first, self._count)]
+
+    def values(self):
+        # Raw sample values, oldest first
+        with self._lock:
+            return [self._values[self._physical(i)] for i in range(self._count)]
+
+    def window(self, seconds, now=None):
+        # (min, avg, max, count) of the raw samples of the last `seconds`, None if there are none
+        with self._lock:
+            first = self._first_index_since(self._since(seconds, now))
+            if first == self._count:
+                return None
+            lo = hi = self._values[self._physical(first)]
+            total = 0.0
+            for i in range(first, self._count):
+                value = self._values[self._physical(i)]
+                total += value
+                if value < lo:
+                    lo = value
+                elif value > hi:
+                    hi = value
+            count = self._count - first
+            return lo, total / count, hi, count
+
+    def buckets(self, seconds=None, now=None):
+        # [(start, min, avg, max, count), ...] of the downsampled history older than the
+        # raw samples, limited to buckets starting in the last `seconds` (all if None)
+        with self._lock:
+            since = self._since(seconds, now)
+            result = []
+            for i in range(self._b_used):
+                idx = (self._b_first + i) % self.bucket_capacity
+                if self._b_start[idx] < since:
+                    continue
+                count = self._b_count[idx]
+                result.append((self._b_start[idx], self._b_min[idx], self._b_sum[idx] / count, self._b_max[idx], count))
+            return result
+
+    def _since(self, seconds, now):
+        if seconds is None:
+            return float("-inf")
+        return (time.time() if now is None else now) - seconds
+
+    def _physical(self, i):
+        return (self._start + i) % self.capacity
+
+    # Must be called with self._lock held. Logical index of the first sample at or
+    # after `since`, samples are appended in time order so this is a binary search
+    def _first_index_since(self, since):
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ts[self._physical(mid)] < since:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    # Must be called with self._lock held
+    def _fold(self, timestamp, value):
+        if self.bucket_capacity == 0:
+            return
+        start = timestamp - timestamp % self.bucket_sec
+        last = (self._b_first + self._b_used - 1) % self.bucket_capacity
+        if self._b_used > 0 and self._b_start[last] == start:
+            if value < self._b_min[last]:
+                self._b_min[last] = value
+            if value > self._b_max[last]:
+                self._b_max[last] = value
+            self._b_sum[last] += value
+            self._b_count[last] += 1
+            return
+
+        # New bucket, overwriting the oldest one when all are in use
+        if self._b_used == self.bucket_capacity:
+            idx = self._b_first
+            self._b_first = (self._b_first + 1) % self.bucket_capacity
+        else:
+            idx = (self._b_first + self._b_used) % self.bucket_capacity
+            self._b_used += 1
+        self._b_start[idx] = start
+        self._b_min[idx] = value
+        self._b_max[idx] = value
+        self._b_sum[idx] = value
+        self._b_count[idx] = 1
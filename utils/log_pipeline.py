@@ -0,0 +1,190 @@
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+# ============================= CLASSES =============================
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # The stock QueueHandler formats the message in the calling thread. Here records
+    # are queued with their arguments and formatted by the listener thread, so an RPC
+    # only pays for creating the record (arguments must not be mutated afterwards).
+    def prepare(self, record):
+        if record.exc_info:
+            # Tracebacks reference frames of the calling thread, render them now
+            return super().prepare(record)
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    # Thins out hot log messages before they are queued. Messages are grouped by the
+    # `log_type` given with `extra={"log_type": ...}`, messages without one always pass.
+    #   sample_rates - log_type -> fraction of messages kept (e.g. 0.01 keeps every 100th)
+    #   rate_limits  - log_type -> maximum messages per second (token bucket, burst of one second)
+    def __init__(self, sample_rates=None, rate_limits=None):
+        super().__init__()
+        self.sample_every = {log_type: max(1, round(1 / rate)) if rate > 0 else 0 for log_type, rate in (sample_rates or {}).items()}
+        self.rate_limits = dict(rate_limits or {})
+        self.suppressed = {}    # log_type -> number of dropped messages
+        self._counters = {log_type: itertools.count() for log_type in self.sample_every}
+        self._buckets = {log_type: [float(limit), time.monotonic()] for log_type, limit in self.rate_limits.items()}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        log_type = getattr(record, "log_type", None)
+        if log_type is None:
+            return True
+
+        every = self.sample_every.get(log_type)
+        if every is not None and (every == 0 or next(self._counters[log_type]) % every != 0):
+            self._suppress(log_type)
+            return False
+
+        bucket = self._buckets.get(log_type)
+        if bucket is not None:
+            with self._lock:
+                limit = self.rate_limits[log_type]
+                now = time.monotonic()
+                bucket[0] = min(limit, bucket[0] + (now - bucket[1]) * limit)
+                bucket[1] = now
+                if bucket[0] < 1:
+                    self._suppress(log_type)
+                    return False
+                bucket[0] -= 1
+        return True
+
+    def _suppress(self, log_type):
+        # A lost increment under contention only makes the count slightly low
+        self.suppressed[log_type] = self.suppressed.get(log_type, 0) + 1
+
+
+class BatchingFileHandler(logging.Handler):
+    # Collects formatted lines and writes them to the file in one call once
+    # `batch_size` lines are pending or on flush() (called by the listener when idle)
+    def __init__(self, filename, batch_size=256):
+        super().__init__()
+        self.batch_size = batch_size
+        self._file = open(filename, "a", encoding="utf-8")
+        self._pending = []
+
+    def emit(self, record):
+        try:
+            self._pending.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self._pending:
+                self._file.write("\n".join(self._pending) + "\n")
+                self._pending.clear()
+            self._file.flush()
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+        super().close()
+
+
+class JsonLinesFormatter(logging.Formatter):
+    # One JSON object per line
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "msg": record.getMessage(),
+            "thread": record.threadName
+        }
+        log_type = getattr(record, "log_type", None)
+        if log_type is not None:
+            entry["type"] = log_type
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry)
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    # Flushes the handlers whenever the queue has been idle for `flush_interval`
+    # seconds, so batched lines are never held back for long
+    def __init__(self, log_queue, *handlers, flush_interval=0.5):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, self.flush_interval)
+            except queue.Empty:
+                for handler in self.handlers:
+                    handler.flush()
+
+
+class LogPipeline:
+    # Root logger -> SamplingFilter -> DeferredQueueHandler -> queue -> listener thread -> BatchingFileHandler
+    def __init__(self, handler, listener, sampling_filter):
+        self.handler = handler
+        self.listener = listener
+        self.sampling_filter = sampling_filter
+        self._stopped = False
+
+    def stop(self):
+        # Writes out everything queued so far, safe to call more than once
+        if self._stopped:
+            return
+        self._stopped = True
+        if self.sampling_filter.suppressed:
+            logging.info(f"Log messages suppressed by sampling / rate limits: {self.sampling_filter.suppressed}")
+        self.listener.stop()
+        self.handler.close()
+
+
+# ============================= FUNCTIONS =============================
+# Replaces logging.basicConfig(filename=..., level=..., format=...). Everything logged
+# through the root logger is written by one background thread.
+#   log_format - "text" (same lines as before) or "json" (JSON lines)
+def setup_logging(filename, level=logging.INFO, log_format="text", sample_rates=None, rate_limits=None, batch_size=256, flush_interval=0.5):
+    # Our formats don't use the caller's file / line / process, skipping them makes
+    # every LogRecord cheaper (see "Optimization" in the logging HOWTO)
+    logging._srcfile = None
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    handler = BatchingFileHandler(filename, batch_size=batch_size)
+    if log_format == "json":
+        handler.setFormatter(JsonLinesFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    sampling_filter = SamplingFilter(sample_rates, rate_limits)
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(sampling_filter)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+
+    listener = BatchingQueueListener(log_queue, handler, flush_interval=flush_interval)
+    listener.start()
+    pipeline = LogPipeline(handler, listener, sampling_filter)
+    atexit.register(pipeline.stop)
+    return pipeline
+
+# Parses "type=value,type=value" command line options into {type: float}
+def parse_log_limits(text):
+    limits = {}
+    for item in filter(None, text.split(",")):
+        log_type, _, value = item.partition("=")
+        limits[log_type.strip()] = float(value)
+    return limits
@@ -0,0 +1,39 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# ============================= CLASSES =============================
+class TimingMetric:
+    # Count / total / max of a duration, cheap enough to record on every RPC
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def summary(self):
+        with self._lock:
+            avg = self.total / self.count if self.count else 0.0
+            return f"{self.name}: count={self.count}, avg={avg * 1e6:.1f}us, max={self.max * 1e6:.1f}us"
+
+
+# ============================= FUNCTIONS =============================
+@contextmanager
+def timed_lock(lock, metric):
+    # Same as `with lock:` but records how long the lock was held
+    lock.acquire()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        held = time.perf_counter() - start
+        lock.release()
+        metric.record(held)
@@ -0,0 +1,183 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+# ============================= GLOBALS =============================
+# Every segment starts with a header (magic + record size) followed by fixed-width
+# records: timestamp (s since epoch), worker id, load (%), in-flight requests
+MAGIC = b"LBLOAD01"
+HEADER = struct.Struct("<8sI")
+RECORD = struct.Struct("<dIfI")
+SEGMENT_GLOB = "load-*.bin"
+
+# ============================= CLASSES =============================
+class MetricsLogWriter:
+    # Appends load records to a segmented binary log from a background thread, so
+    # the data survives a crash and nothing has to be written on shutdown.
+    #   directory       - Where the segments (load-000001.bin, ...) are written
+    #   segment_records - Records per segment before rotating to a new one
+    #   max_segments    - Oldest segments are deleted beyond this many
+    #   flush_interval  - Seconds between flushes, at most this much data is lost on a crash
+    #   reset           - Delete the segments of a previous run first
+    # append() never blocks: when the writer falls behind by `max_pending` records
+    # new ones are dropped and counted in `dropped`.
+    def __init__(self, directory, segment_records=1_000_000, max_segments=16, flush_interval=1.0, max_pending=100_000, reset=False):
+        self.directory = Path(directory)
+        self.segment_records = segment_records
+        self.max_segments = max_segments
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if reset:
+            for path in segment_paths(self.directory):
+                path.unlink()
+        existing = segment_paths(self.directory)
+        self._next_segment = segment_number(existing[-1]) + 1 if existing else 1
+        self._file = None
+        self._segment_count = 0     # Records in the current segment
+
+        self.max_pending = max_pending
+        self._pending = deque()     # deque.append / popleft are atomic, no lock on the append path
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def append(self, worker_id, load, in_flight, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append((timestamp, worker_id, load, in_flight))
+
+    def close(self):
+        # Writes out everything appended so far and closes the current segment
+        self._closed.set()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            closing = self._closed.wait(self.flush_interval)
+            batch = bytearray()
+            pending = self._pending
+            while pending:
+                batch += RECORD.pack(*pending.popleft())
+            try:
+                self._write(batch)
+                if self._file is not None:
+                    self._file.flush()
+            except OSError as e:
+                logging.error(f"Writing the metrics log failed: {e}")
+            if closing:
+                break
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, batch):
+        # Splits the batch so that every segment holds exactly segment_records records
+        view = memoryview(batch)
+        while view:
+            if self._file is None or self._segment_count >= self.segment_records:
+                self._rotate()
+            n_records = min(len(view) // RECORD.size, self.segment_records - self._segment_count)
+            self._file.write(view[:n_records * RECORD.size])
+            view = view[n_records * RECORD.size:]
+            self._segment_count += n_records
+            self.written += n_records
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        path = self.directory / f"load-{self._next_segment:06d}.bin"
+        self._next_segment += 1
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, RECORD.size))
+        self._segment_count = 0
+
+        # Retention, the new (empty) segment counts as one
+        for old in segment_paths(self.directory)[:-self.max_segments]:
+            old.unlink()
+
+
+class MetricsLogReader:
+    # Reads the segments written by MetricsLogWriter through mmap, nothing is copied
+    # until a record is unpacked. A partially written last record is ignored.
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def segments(self):
+        return segment_paths(self.directory)
+
+    def records(self):
+        # Yields (timestamp, worker_id, load, in_flight) of every segment, oldest first
+        for path in self.segments():
+            with open(path, "rb") as f, map_segment(f) as data:
+                if data is None:
+                    continue
+                end = HEADER.size + (len(data) - HEADER.size) // RECORD.size * RECORD.size
+                for offset in range(HEADER.size, end, RECORD.size):
+                    yield RECORD.unpack_from(data, offset)
+
+    def columns(self):
+        # {worker_id: (timestamps, loads, in_flights)}, for plotting
+        result = {}
+        for timestamp, worker_id, load, in_flight in self.records():
+            columns = result.get(worker_id)
+            if columns is None:
+                columns = result[worker_id] = ([], [], [])
+            columns[0].append(timestamp)
+            columns[1].append(load)
+            columns[2].append(in_flight)
+        return result
+
+    def to_numpy(self):
+        # All records as one NumPy structured array, much faster than columns() for
+        # millions of records (needs NumPy)
+        import numpy as np
+        dtype = np.dtype([("timestamp", "<f8"), ("worker_id", "<u4"), ("load", "<f4"), ("in_flight", "<u4")])
+        assert dtype.itemsize == RECORD.size
+        arrays = []
+        for path in self.segments():
+            with open(path, "rb") as f, map_segment(f) as data:
+                if data is None:
+                    continue
+                count = (len(data) - HEADER.size) // RECORD.size
+                # Copied so that the array outlives the mapping
+                arrays.append(np.frombuffer(data, dtype=dtype, count=count, offset=HEADER.size).copy())
+        if not arrays:
+            return np.empty(0, dtype=dtype)
+        return np.concatenate(arrays)
+
+
+# ============================= FUNCTIONS =============================
+def segment_paths(directory):
+    return sorted(Path(directory).glob(SEGMENT_GLOB), key=segment_number)
+
+def segment_number(path):
+    return int(path.stem.split("-")[1])
+
+# Maps a segment read-only, yields None for an empty or foreign file
+@contextmanager
+def map_segment(f):
+    if os.fstat(f.fileno()).st_size < HEADER.size:
+        yield None
+        return
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        magic, record_size = HEADER.unpack_from(data)
+        if magic != MAGIC or record_size != RECORD.size:
+            logging.warning(f"Skipping {f.name}, not a load log segment")
+            yield None
+        else:
+            yield data
+    finally:
+        data.close()
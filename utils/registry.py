@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import grpc
+import requests
+
+from discovery import ServiceCache, AsyncServiceWatch, get_service_cache
+
+sys.path.append(str(Path(__file__).parent.resolve() / "../generated"))
+import lb_pb2
+import lb_pb2_grpc as lb_grpc
+
+# ============================= GLOBALS =============================
+DEFAULT_REGISTRY = "consul://localhost:8500"
+LOOKUP_TTL_SEC = 60     # RemoteRegistry caches non-empty lookups this long
+
+_registry = None
+
+# ============================= CLASSES =============================
+class Registry:
+    # Where services register and are looked up. Health maps are {port: "active" / "inactive"}.
+    #   register(name, service_id, port, check_interval) - Adds or replaces a service instance
+    #   deregister(service_id)
+    #   lookup(name)              - [(address, port), ...] of the instances of a service
+    #   watch_health(name, on_change) / watch_health_async(name, on_change)
+    #                             - Calls on_change with the health map of a service whenever it changes
+    #   set_passing(service_id, passing) - Health reported by the process hosting the registry
+    def register(self, name, service_id, port, check_interval):
+        raise NotImplementedError
+
+    def deregister(self, service_id):
+        raise NotImplementedError
+
+    def lookup(self, name):
+        raise NotImplementedError
+
+    def watch_health(self, name, on_change):
+        raise NotImplementedError
+
+    async def watch_health_async(self, name, on_change):
+        raise NotImplementedError
+
+    def set_passing(self, service_id, passing):
+        # Registries with their own health checks (Consul) ignore this
+        pass
+
+
+class ConsulRegistry(Registry):
+    # Consul agent HTTP API over one pooled session, instead of the `consul` CLI
+    def __init__(self, base_url="http://localhost:8500"):
+        self.base_url = base_url.rstrip("/")
+        self._session = requests.Session()
+        self._lock = threading.Lock()   # requests.Session is not documented as thread safe
+
+    def register(self, name, service_id, port, check_interval):
+        definition = {
+            "Name": name,
+            "ID": service_id,
+            "Port": port,
+            "Check": {
+                "HTTP": f"http://localhost:{port}/health",
+                "Interval": f"{check_interval}s"
+            }
+        }
+        with self._lock:
+            response = self._session.put(f"{self.base_url}/v1/agent/service/register", json=definition, timeout=5)
+        response.raise_for_status()
+
+    def deregister(self, service_id):
+        with self._lock:
+            response = self._session.put(f"{self.base_url}/v1/agent/service/deregister/{service_id}", timeout=5)
+        response.raise_for_status()
+
+    def lookup(self, name):
+        # Served from the shared discovery cache, only the first call goes to Consul
+        response = get_service_cache(f"{self.base_url}/v1/catalog/service/{name}").get()
+        return [(service["ServiceAddress"] or service["Address"], service["ServicePort"]) for service in response or []]
+
+    def watch_health(self, name, on_change):
+        url = f"{self.base_url}/v1/health/service/{name}"
+        return ServiceCache(url, on_change=lambda response: on_change(consul_health(response))).start()
+
+    async def watch_health_async(self, name, on_change):
+        url = f"{self.base_url}/v1/health/service/{name}"
+        await AsyncServiceWatch(url, lambda response: on_change(consul_health(response))).run()
+
+
+class LocalRegistry(Registry):
+    # Registry kept in memory by the LB and served to other processes over the
+    # Registry gRPC service. The LB reports the health of the instances with
+    # set_passing (a worker is alive while its load stream is open). Watchers are
+    # called outside the lock.
+    def __init__(self):
+        self._services = {}     # id -> lb_pb2.ServiceEntry
+        self._watchers = []     # [(name, on_change), ...]
+        self._lock = threading.Lock()
+
+    def register(self, name, service_id, port, check_interval=None, address="localhost"):
+        self.add(lb_pb2.ServiceEntry(name=name, id=service_id, address=address, port=port, passing=True))
+
+    def add(self, entry):
+        with self._lock:
+            self._services[entry.id] = entry
+        self._notify(entry.name)
+
+    def deregister(self, service_id):
+        with self._lock:
+            entry = self._services.pop(service_id, None)
+        if entry is not None:
+            self._notify(entry.name)
+
+    def set_passing(self, service_id, passing):
+        with self._lock:
+            entry = self._services.get(service_id)
+            if entry is None or entry.passing == passing:
+                return
+            entry.passing = passing
+        self._notify(entry.name)
+
+    def entries(self, name):
+        with self._lock:
+            return [entry for entry in self._services.values() if entry.name == name]
+
+    def lookup(self, name):
+        return [(entry.address, entry.port) for entry in self.entries(name)]
+
+    def health(self, name):
+        return {entry.port: "active" if entry.passing else "inactive" for entry in self.entries(name)}
+
+    def watch_health(self, name, on_change):
+        with self._lock:
+            self._watchers.append((name, on_change))
+        on_change(self.health(name))
+        return self
+
+    async def watch_health_async(self, name, on_change):
+        # Changes are pushed by the calls above, the task only has to stay alive
+        self.watch_health(name, on_change)
+        await asyncio.Future()
+
+    def _notify(self, name):
+        with self._lock:
+            watchers = [on_change for watched, on_change in self._watchers if watched == name]
+        if watchers:
+            health = self.health(name)
+            for on_change in watchers:
+                on_change(health)
+
+
+class RemoteRegistry(Registry):
+    # Client of the LocalRegistry of an LB (the Registry gRPC service at `address`)
+    def __init__(self, address):
+        self.address = address
+        self._channel = grpc.insecure_channel(address)
+        self._stub = lb_grpc.RegistryStub(self._channel)
+        self._cache = {}    # name -> (time, [(address, port), ...])
+        self._lock = threading.Lock()
+
+    def register(self, name, service_id, port, check_interval=None, address="localhost"):
+        entry = lb_pb2.ServiceEntry(name=name, id=service_id, address=address, port=port)
+        # The LB may still be starting up
+        response = self._stub.Register(lb_pb2.RegisterServiceRequest(service=entry), timeout=10, wait_for_ready=True)
+        if response.err_code != 0:
+            raise RuntimeError(response.msg)
+
+    def deregister(self, service_id):
+        self._stub.Deregister(lb_pb2.DeregisterServiceRequest(id=service_id), timeout=5)
+
+    def lookup(self, name):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(name)
+        if cached is not None and now - cached[0] < LOOKUP_TTL_SEC:
+            return cached[1]
+        response = self._stub.Lookup(lb_pb2.LookupRequest(name=name), timeout=10, wait_for_ready=True)
+        services = [(entry.address, entry.port) for entry in response.services]
+        # Empty results are not cached, the service may just not be registered yet
+        if services:
+            with self._lock:
+                self._cache[name] = (now, services)
+        return services
+
+    def watch_health(self, name, on_change):
+        raise NotImplementedError("Health is watched by the LB hosting the registry")
+
+    async def watch_health_async(self, name, on_change):
+        raise NotImplementedError("Health is watched by the LB hosting the registry")
+
+
+# ============================= FUNCTIONS =============================
+def consul_health(response):
+    health = {}
+    for service in response:
+        status = service["Checks"][0]["Status"]
+        health[service["Service"]["Port"]] = "active" if status == "passing" else "inactive"
+    return health
+
+# "consul://host:port" (default) or "lb://host:port", the LB at that address hosts the registry.
+# `local=True` is used by that LB itself to get the in-memory registry.
+def create_registry(spec, local=False):
+    parts = urlsplit(spec if "://" in spec else spec + "://")
+    if parts.scheme == "consul":
+        return ConsulRegistry(f"http://{parts.netloc or 'localhost:8500'}")
+    if parts.scheme == "lb":
+        if local:
+            return LocalRegistry()
+        if not parts.netloc:
+            raise ValueError("lb registry needs the LB address, e.g. lb://localhost:50051")
+        return RemoteRegistry(parts.netloc)
+    raise ValueError(f"Unknown registry {spec}, expected consul://host:port or lb://host:port")
+
+def set_registry(registry):
+    global _registry
+    _registry = registry
+
+def get_registry():
+    # Process wide registry used by get_lb_port() / get_ll_port(), Consul unless set_registry was called
+    global _registry
+    if _registry is None:
+        _registry = create_registry(DEFAULT_REGISTRY)
+    return _registry
@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# ============================= CLASSES =============================
+class ResultCache:
+    # Memoizes results of deterministic jobs by key, e.g. (type, n).
+    #   max_size - Maximum number of cached results, the eviction policy picks which one goes first
+    #   ttl      - Seconds a result stays valid (None: no expiry)
+    #   eviction - "lru" (a hit moves the entry to the back) or "fifo" (oldest computed result goes first)
+    # Concurrent requests for a key that is being computed wait for that computation
+    # instead of starting their own (request coalescing). Failures are not cached.
+    def __init__(self, max_size=1024, ttl=None, eviction="lru"):
+        if eviction not in ("lru", "fifo"):
+            raise ValueError(f"Unknown eviction policy {eviction}")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.eviction = eviction
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0      # Requests that waited for another request's computation
+        self.evictions = 0
+
+        self._entries = OrderedDict()   # key -> (value, expires_at)
+        self._pending = {}              # key -> Future of the running computation
+        self._tasks = set()             # Running async computations (keeps them referenced)
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        # `compute()` is called at most once per key at a time, exceptions are raised to every waiter
+        future, owner = self._claim(key)
+        if not owner:
+            return future.result()
+        try:
+            value = compute()
+        except BaseException as e:
+            self._fail(key, future, e)
+            raise
+        self._store(key, future, value)
+        return value
+
+    async def get_or_compute_async(self, key, compute):
+        # Same as get_or_compute for the event loop, `compute()` returns an awaitable.
+        # The computation runs in its own task and every caller (the one that started it
+        # too) waits through a shield, so a cancelled RPC neither cancels the shared
+        # future nor the computation the other requests are waiting for.
+        future, owner = self._claim(key)
+        if owner:
+            task = asyncio.ensure_future(self._compute_async(key, future, compute))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    async def _compute_async(self, key, future, compute):
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            # Only happens when the event loop shuts down, waiters get an error instead
+            self._fail(key, future, RuntimeError("Computation cancelled"))
+            raise
+        except BaseException as e:
+            self._fail(key, future, e)
+            return
+        self._store(key, future, value)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    # Returns (future, owner). A hit returns an already completed future, a miss
+    # returns a new future that the caller (owner) has to complete
+    def _claim(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or time.monotonic() < expires_at:
+                    self.hits += 1
+                    if self.eviction == "lru":
+                        self._entries.move_to_end(key)
+                    future = Future()
+                    future.set_result(value)
+                    return future, False
+                del self._entries[key]
+
+            future = self._pending.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+
+            self.misses += 1
+            future = Future()
+            self._pending[key] = future
+            return future, True
+
+    def _store(self, key, future, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            del self._pending[key]
+            if self.max_size > 0:
+                self._entries[key] = (value, expires_at)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        future.set_result(value)
+
+    def _fail(self, key, future, exc):
+        with self._lock:
+            del self._pending[key]
+        future.set_exception(exc)
@@ -1,11 +1,7 @@
 from enum import Enum
 import os
 import sys
-import requests
-
-CONSUL_URL_LB = "http://localhost:8500/v1/catalog/service/load-balancer"
-CONSUL_URL_LL = "http://localhost:8500/v1/catalog/service/load-listener"
-CONSUL_URL_WORKER = "http://localhost:8500/v1/health/service/worker"
+from registry import get_registry
 
 class ComputeType(Enum):
     SUM_TO_N = 1
@@ -22,16 +18,23 @@ def wait_for_enter():
         if char == "\n":            # Only proceed if Enter is pressed
             break
 
+# Routing key of a Compute request for the LB's ring policy, identical jobs map to the same worker
+def routing_key(job_type, n):
+    return f"{job_type}:{n}"
+
+# Registry service id of a worker, the LB uses it to report the worker's health
+def worker_service_id(worker_id):
+    return f"w-{worker_id}"
+
+# Both lookups go to the process wide registry (Consul unless --registry says otherwise) and are cached there
 def get_lb_port():
-    response = requests.get(CONSUL_URL_LB).json()
-    if response:
-        service = response[0]
-        return service['ServicePort']
+    services = get_registry().lookup("load-balancer")
+    if services:
+        return services[0][1]
     return None
 
 def get_ll_port():
-    response = requests.get(CONSUL_URL_LL).json()
-    if response:
-        service = response[0]
-        return service['ServicePort']
-    return None
\ No newline at end of file
+    services = get_registry().lookup("load-listener")
+    if services:
+        return services[0][1]
+    return None
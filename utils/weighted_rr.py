@@ -0,0 +1,58 @@
+import threading
+
+# ============================= CLASSES =============================
+class SmoothWeightedRoundRobin:
+    # nginx's smooth weighted round-robin. Every pick adds each key's weight to its
+    # current value, picks the key with the highest current value and subtracts the
+    # total weight from it. Over any `total` consecutive picks a key with weight w is
+    # picked exactly w times, and the picks are interleaved (weights 5,1,1 give
+    # a a b a c a a instead of a a a a a b c). Adding, removing and reweighting a key
+    # is O(1), a pick is O(n). Safe to call from several threads.
+    def __init__(self):
+        self._weights = {}      # key -> weight
+        self._current = {}      # key -> current value
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._weights)
+
+    def __contains__(self, key):
+        return key in self._weights
+
+    def weight(self, key):
+        return self._weights[key]
+
+    def set(self, key, weight):
+        # Inserts the key or changes its weight, its current value is kept so a
+        # reweighted key is not picked in a burst
+        if weight <= 0:
+            raise ValueError("Weight must be positive")
+        with self._lock:
+            self._total += weight - self._weights.get(key, 0)
+            self._weights[key] = weight
+            self._current.setdefault(key, 0)
+
+    def remove(self, key):
+        with self._lock:
+            weight = self._weights.pop(key, None)
+            if weight is None:
+                return
+            self._total -= weight
+            del self._current[key]
+
+    def pick(self):
+        # Returns the next key or None if there are none
+        with self._lock:
+            best = None
+            best_current = None
+            current = self._current
+            for key, weight in self._weights.items():
+                value = current[key] + weight
+                current[key] = value
+                if best is None or value > best_current:
+                    best = key
+                    best_current = value
+            if best is not None:
+                current[best] = best_current - self._total
+            return best